@@ -0,0 +1,12 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Benchmarks for `krakenex`. Run modules from the repository root, e.g.:
+
+.. code-block:: sh
+
+   python -m benchmarks.decode
+
+or all of them, keeping the results, with ``python -m benchmarks.run``.
+
+"""
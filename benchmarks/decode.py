@@ -0,0 +1,95 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Response body decoding, with each available backend.
+
+Compares the default path (:py:mod:`json` on a decoded string, as
+:py:meth:`requests.Response.json` does), alone and with options set by
+:py:meth:`krakenex.API.json_options`, with :py:mod:`krakenex.decoders`,
+with and without conversion of numeric strings. The ``manual`` cases
+are the baseline for conversion: the default path, then the caller
+converting the numeric columns of the result itself.
+
+"""
+
+import decimal
+import json
+from collections import OrderedDict
+
+from krakenex import decoders
+
+from . import payloads
+from .timing import measure, report
+
+#: :py:meth:`krakenex.API.json_options` to try, one at a time
+OPTIONS = (
+    ('parse_float', decimal.Decimal),
+    ('object_pairs_hook', OrderedDict),
+)
+
+def _depth(result, number):
+    for book in result.values():
+        for side in ('asks', 'bids'):
+            book[side] = [[number(price), number(volume), t]
+                          for price, volume, t in book[side]]
+
+def _trades(result, number):
+    for pair, rows in result.items():
+        if pair != 'last':
+            result[pair] = [[number(row[0]), number(row[1])] + row[2:]
+                            for row in rows]
+
+def _ohlc(result, number):
+    for pair, rows in result.items():
+        if pair != 'last':
+            result[pair] = [[row[0]] + [number(x) for x in row[1:7]] + row[7:]
+                            for row in rows]
+
+#: method -> function converting the numeric columns of a result in place,
+#: as a caller would
+MANUAL = {
+    'Depth': _depth,
+    'Trades': _trades,
+    'OHLC': _ohlc,
+}
+
+def _manual(body, convert, number):
+    response = json.loads(body.decode())
+    convert(response['result'], number)
+    return response
+
+def benchmarks():
+    """ Benchmarks in this module.
+
+    :returns: benchmark name -> function of no arguments
+    :rtype: dict
+
+    """
+    cases = OrderedDict()
+    for method, body in payloads.bodies().items():
+        cases['decode.{}.default'.format(method)] = \
+            lambda body=body: json.loads(body.decode())
+        for option, value in OPTIONS:
+            cases['decode.{}.default+{}'.format(method, option)] = \
+                lambda body=body, options={option: value}: \
+                    json.loads(body.decode(), **options)
+        for number in (float, decimal.Decimal):
+            cases['decode.{}.manual+{}'.format(method, number.__name__)] = \
+                lambda body=body, convert=MANUAL[method], number=number: \
+                    _manual(body, convert, number)
+        for backend in ('json', 'orjson', 'simdjson'):
+            try:
+                decoders.loads(backend)
+            except ImportError:
+                continue
+            for numbers in (None, float, decimal.Decimal):
+                decode = decoders.decoder(backend, numbers)
+                name = 'decode.{}.{}'.format(method, backend)
+                if numbers is not None:
+                    name += '+' + numbers.__name__
+                cases[name] = lambda body=body, decode=decode: decode(body)
+    return cases
+
+if __name__ == '__main__':
+    report(OrderedDict((name, measure(function))
+                       for name, function in benchmarks().items()))
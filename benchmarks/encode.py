@@ -0,0 +1,32 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""URL-encoding of request parameters, as for every private query."""
+
+import urllib.parse
+from collections import OrderedDict
+
+from . import payloads
+from .timing import measure, report
+
+def benchmarks():
+    """ Benchmarks in this module.
+
+    :returns: benchmark name -> function of no arguments
+    :rtype: dict
+
+    """
+    order = dict(payloads.order(), nonce=1700000000000000)
+    batch = {'pair': 'XXBTZUSD', 'nonce': 1700000000000000,
+             'orders': str([payloads.order() for _ in range(15)])}
+    cancel = {'txid': 'OQCLML-BW3P3-BUCMWZ', 'nonce': 1700000000000000}
+
+    cases = OrderedDict()
+    cases['encode.AddOrder'] = lambda: urllib.parse.urlencode(order)
+    cases['encode.AddOrderBatch'] = lambda: urllib.parse.urlencode(batch)
+    cases['encode.CancelOrder'] = lambda: urllib.parse.urlencode(cancel)
+    return cases
+
+if __name__ == '__main__':
+    report(OrderedDict((name, measure(function))
+                       for name, function in benchmarks().items()))
@@ -0,0 +1,108 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Query latency with each connection setting, against a local simulator.
+
+Compares a first query on a cold connection with one after
+:py:meth:`krakenex.API.warmup`, and many queries at once with pools of
+different sizes, blocking or not, and over HTTP/2 if :py:mod:`httpx`
+is installed.
+
+Connection setup is cheap on loopback without TLS. For numbers closer
+to a real deployment, give a certificate for ``127.0.0.1`` (e.g. made
+with ``openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=127.0.0.1
+-addext subjectAltName=IP:127.0.0.1 -keyout key.pem -out cert.pem``)
+in the ``KRAKENEX_BENCHMARK_CERT`` and ``KRAKENEX_BENCHMARK_KEY``
+environment variables. The simulator does not speak HTTP/2, so that
+case is only run over TLS, where it falls back to HTTP/1.1 through
+:py:mod:`httpx`.
+
+"""
+
+import concurrent.futures
+import os
+from collections import OrderedDict
+
+import krakenex.testing
+
+from .timing import report
+
+#: simulator serving the benchmarks, once started
+simulator = None
+
+#: queries in flight at once, for the concurrent cases
+CONCURRENCY = 32
+
+def _simulator():
+    global simulator
+    if simulator is None:
+        simulator = krakenex.testing.Simulator(
+            limit=False, seed=1,
+            certfile=os.environ.get('KRAKENEX_BENCHMARK_CERT'),
+            keyfile=os.environ.get('KRAKENEX_BENCHMARK_KEY')
+        ).start()
+    return simulator
+
+def _cold(warm):
+    """ Seconds for a first query from a new object. """
+    import time
+
+    api = _simulator().api()
+    if warm:
+        api.warmup()
+    connections = simulator.connections
+    began = time.perf_counter()
+    api.query_public('Time')
+    seconds = time.perf_counter() - began
+    api.close()
+    if warm:
+        assert simulator.connections == connections, \
+            'first query after warmup() opened a new connection'
+    return seconds
+
+def _concurrent(api, queries=CONCURRENCY * 8):
+    """ Seconds per query, with :py:data:`CONCURRENCY` in flight. """
+    import time
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        began = time.perf_counter()
+        list(pool.map(lambda _: api.query_public('Time'), range(queries)))
+        return (time.perf_counter() - began) / queries
+
+def _cases():
+    cases = OrderedDict()
+    cases['latency.first.cold'] = lambda: _cold(False)
+    cases['latency.first.warm'] = lambda: _cold(True)
+
+    for size, block in ((1, True), (10, False), (10, True), (CONCURRENCY, False)):
+        api = _simulator().api().connection_pool(size, block)
+        api.warmup(size)
+        name = 'latency.concurrent.pool{}{}'.format(size, '+block' if block else '')
+        cases[name] = lambda api=api: _concurrent(api)
+
+    if _simulator().certfile is not None:
+        try:
+            api = _simulator().api().connection_pool(CONCURRENCY, http2=True)
+        except ImportError:
+            pass
+        else:
+            cases['latency.concurrent.http2'] = lambda api=api: _concurrent(api)
+    return cases
+
+def run(repeat=5):
+    """ Measure latencies.
+
+    Unlike other modules, cases here time themselves, since a cold
+    connection cannot be timed repeatedly with :py:mod:`timeit`.
+
+    :param repeat: (optional) runs of each case; the best is kept
+    :type repeat: int
+    :returns: benchmark name -> seconds per query
+    :rtype: dict
+
+    """
+    return OrderedDict((name, min(function() for _ in range(repeat)))
+                       for name, function in _cases().items())
+
+if __name__ == '__main__':
+    report(run())
@@ -0,0 +1,40 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Nonce generation, with each nonce source."""
+
+import os
+import tempfile
+from collections import OrderedDict
+
+import krakenex
+
+from .timing import measure, report
+
+def benchmarks():
+    """ Benchmarks in this module.
+
+    Counters backed by files keep them in a temporary directory, which
+    is left for the operating system to clean up.
+
+    :returns: benchmark name -> function of no arguments
+    :rtype: dict
+
+    """
+    directory = tempfile.mkdtemp(prefix='krakenex-benchmarks-')
+    api = krakenex.API()
+
+    cases = OrderedDict()
+    cases['nonce.memory'] = api._nonce
+    cases['nonce.file'] = krakenex.NonceCounter(os.path.join(directory, 'file'))
+    try:
+        cases['nonce.shared'] = krakenex.SharedNonceCounter(
+            os.path.join(directory, 'shared'))
+    except OSError:
+        # not on POSIX
+        pass
+    return cases
+
+if __name__ == '__main__':
+    report(OrderedDict((name, measure(function))
+                       for name, function in benchmarks().items()))
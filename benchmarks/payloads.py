@@ -0,0 +1,71 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Request and response payloads, shaped like those recorded from Kraken.
+
+Values are generated deterministically, so runs are comparable.
+
+"""
+
+import base64
+import json
+import random
+
+#: API secret of the usual length; not a real one
+SECRET = base64.b64encode(random.Random(0).getrandbits(512).to_bytes(64, 'big')).decode()
+
+def _price(rng, base):
+    return '{:.5f}'.format(base + rng.uniform(-500, 500))
+
+def _volume(rng):
+    return '{:.8f}'.format(rng.expovariate(2))
+
+def depth(levels=500):
+    """ ``Depth`` response with ``levels`` entries on each side. """
+    rng = random.Random(1)
+    t = 1700000000
+    return {'error': [], 'result': {'XXBTZUSD': {
+        'asks': [[_price(rng, 67000), _volume(rng), t + i] for i in range(levels)],
+        'bids': [[_price(rng, 66000), _volume(rng), t + i] for i in range(levels)],
+    }}}
+
+def trades(count=1000):
+    """ ``Trades`` response with ``count`` trades. """
+    rng = random.Random(2)
+    t = 1700000000.0
+    rows = []
+    for i in range(count):
+        t += rng.expovariate(1)
+        rows.append([_price(rng, 67000), _volume(rng), round(t, 4),
+                     rng.choice('bs'), rng.choice('lm'), '', 60000000 + i])
+    return {'error': [], 'result': {'XXBTZUSD': rows,
+                                    'last': str(int(t * 1000000000))}}
+
+def ohlc(count=720):
+    """ ``OHLC`` response with ``count`` bars. """
+    rng = random.Random(3)
+    t = 1700000000
+    rows = []
+    for i in range(count):
+        o, h, l, c, v = [_price(rng, 67000) for _ in range(5)]
+        rows.append([t + 60 * i, o, h, l, c, v, _volume(rng), rng.randint(1, 500)])
+    return {'error': [], 'result': {'XXBTZUSD': rows, 'last': t + 60 * count}}
+
+def bodies():
+    """ Serialised bodies, by method name.
+
+    :rtype: dict
+
+    """
+    return {
+        'Depth': json.dumps(depth()).encode(),
+        'Trades': json.dumps(trades()).encode(),
+        'OHLC': json.dumps(ohlc()).encode(),
+    }
+
+def order():
+    """ ``AddOrder`` request parameters for a typical limit order. """
+    return {'pair': 'XXBTZUSD', 'type': 'buy', 'ordertype': 'limit',
+            'price': '67012.5', 'volume': '0.01250000',
+            'oflags': 'post,fciq', 'timeinforce': 'GTC',
+            'userref': 1700000000}
@@ -0,0 +1,47 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Whole queries, against a local :py:class:`krakenex.testing.Simulator`.
+
+Measures the client and the loopback round trip: session handling,
+signing, sending, and decoding. The simulator answers at once, and does
+not enforce rate limits.
+
+"""
+
+from collections import OrderedDict
+
+import krakenex.testing
+
+from .timing import measure, report
+
+#: simulator serving the benchmarks, once started
+simulator = None
+
+def benchmarks():
+    """ Benchmarks in this module.
+
+    Starts a simulator, which runs until the process exits.
+
+    :returns: benchmark name -> function of no arguments
+    :rtype: dict
+
+    """
+    global simulator
+    if simulator is None:
+        simulator = krakenex.testing.Simulator(limit=False, seed=1).start()
+    api = simulator.api()
+    cached = simulator.api()
+    cached.cache = krakenex.ResponseCache()
+
+    cases = OrderedDict()
+    cases['query.public.Time'] = lambda: api.query_public('Time')
+    cases['query.public.Depth'] = lambda: api.query_public(
+        'Depth', {'pair': 'XXBTZUSD', 'count': 500})
+    cases['query.public.Time+cache'] = lambda: cached.query_public('Time')
+    cases['query.private.Balance'] = lambda: api.query_private('Balance')
+    return cases
+
+if __name__ == '__main__':
+    report(OrderedDict((name, measure(function))
+                       for name, function in benchmarks().items()))
@@ -0,0 +1,141 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Run benchmark modules, keep the results, and compare with earlier ones.
+
+.. code-block:: sh
+
+   # all modules; saved as benchmarks/results/<krakenex version>.json
+   python -m benchmarks.run --save
+
+   # compare with a release's results, by version or path
+   python -m benchmarks.run --compare 2.2.2
+
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+from collections import OrderedDict
+
+from krakenex import version
+
+from .timing import measure, report
+
+#: benchmark modules, in running order
+MODULES = ('nonce', 'encode', 'sign', 'decode', 'query', 'latency')
+
+#: directory results are saved in
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+def run(modules=MODULES, repeat=5):
+    """ Run benchmarks.
+
+    :param modules: (optional) names of modules in this package
+    :type modules: iterable
+    :param repeat: (optional) passed to :py:func:`timing.measure`
+    :type repeat: int
+    :returns: benchmark name -> best seconds per call
+    :rtype: dict
+
+    """
+    results = OrderedDict()
+    for name in modules:
+        module = importlib.import_module('benchmarks.' + name)
+        if hasattr(module, 'run'):
+            # cases that time themselves
+            results.update(module.run(repeat))
+            continue
+        for case, function in module.benchmarks().items():
+            results[case] = measure(function, repeat)
+    return results
+
+def save(results, path=None):
+    """ Save results, with a description of where they were measured.
+
+    :param results: benchmark name -> seconds per call
+    :type results: dict
+    :param path: (optional) file to save to; named after the
+                 ``krakenex`` version in :py:data:`RESULTS` if not given
+    :type path: str
+    :returns: path saved to
+    :rtype: str
+
+    """
+    if path is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        path = os.path.join(RESULTS, version.__version__ + '.json')
+    document = OrderedDict([
+        ('krakenex', version.__version__),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('date', datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')),
+        ('results', results),
+    ])
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=1)
+        f.write('\n')
+    return path
+
+def load(name):
+    """ Load saved results.
+
+    :param name: path, or ``krakenex`` version saved in :py:data:`RESULTS`
+    :type name: str
+    :returns: benchmark name -> seconds per call
+    :rtype: dict
+
+    """
+    path = name if os.path.exists(name) else \
+           os.path.join(RESULTS, name + '.json')
+    with open(path, 'r') as f:
+        return json.load(f)['results']
+
+def compare(results, baseline):
+    """ Print results next to a baseline, as a table.
+
+    Ratios above 1 are slower than the baseline.
+
+    :param results: benchmark name -> seconds per call
+    :type results: dict
+    :param baseline: benchmark name -> seconds per call
+    :type baseline: dict
+    :returns: None
+
+    """
+    width = max(len(name) for name in results)
+    for name, seconds in results.items():
+        line = '{}  {:>12.3f} us'.format(name.ljust(width), seconds * 1e6)
+        if name in baseline:
+            line += '  {:>12.3f} us  {:>6.2f}x'.format(
+                baseline[name] * 1e6, seconds / baseline[name])
+        print(line)
+    return
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('modules', nargs='*', default=list(MODULES),
+                        help='modules to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing runs per benchmark; the best is kept')
+    parser.add_argument('--save', nargs='?', const='', metavar='PATH',
+                        help='save results, by default under the version')
+    parser.add_argument('--compare', metavar='VERSION_OR_PATH',
+                        help='compare with saved results')
+    args = parser.parse_args(argv)
+
+    results = run(args.modules, args.repeat)
+    if args.compare is not None:
+        compare(results, load(args.compare))
+    else:
+        report(results)
+    if args.save is not None:
+        print('Saved as ' + save(results, args.save or None))
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Private request signing.
+
+Compares :py:meth:`krakenex.API._sign`, which copies an HMAC keyed
+once, with keying a new HMAC from the base64-encoded secret on every
+call, as earlier versions did.
+
+"""
+
+import base64
+import hashlib
+import hmac
+import urllib.parse
+from collections import OrderedDict
+
+import krakenex
+
+from . import payloads
+from .timing import measure, report
+
+def _sign_uncached(data, urlpath, secret):
+    postdata = urllib.parse.urlencode(data)
+    encoded = (str(data['nonce']) + postdata).encode()
+    message = urlpath.encode() + hashlib.sha256(encoded).digest()
+    signature = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+    return base64.b64encode(signature.digest()).decode()
+
+def _keyed(api, message):
+    signature = api._hmac()
+    signature.update(message)
+    return signature.digest()
+
+def benchmarks():
+    """ Benchmarks in this module.
+
+    :returns: benchmark name -> function of no arguments
+    :rtype: dict
+
+    """
+    api = krakenex.API('key', payloads.SECRET)
+    urlpath = '/0/private/AddOrder'
+    data = dict(payloads.order(), nonce=1700000000000000)
+
+    message = urlpath.encode() + bytes(hashlib.sha256().digest_size)
+
+    cases = OrderedDict()
+    # the HMAC alone; the rest of signing is the same either way
+    cases['sign.hmac.new'] = lambda: hmac.new(
+        base64.b64decode(payloads.SECRET), message, hashlib.sha512
+    ).digest()
+    cases['sign.hmac.copy'] = lambda: _keyed(api, message)
+    cases['sign.uncached'] = lambda: _sign_uncached(data, urlpath,
+                                                    payloads.SECRET)
+    cases['sign.cached'] = lambda: api._sign(data, urlpath)
+    # nonce, URL path and signature, as for every private query
+    cases['sign.private'] = lambda: api._private('AddOrder', dict(data))
+    return cases
+
+if __name__ == '__main__':
+    report(OrderedDict((name, measure(function))
+                       for name, function in benchmarks().items()))
@@ -0,0 +1,34 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Shared timing helpers."""
+
+import timeit
+
+def measure(function, repeat=5):
+    """ Time a function of no arguments.
+
+    :param function: code to time
+    :type function: callable
+    :param repeat: (optional) number of timing runs; the best is kept
+    :type repeat: int
+    :returns: best seconds per call
+    :rtype: float
+
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def report(results):
+    """ Print results as a table.
+
+    :param results: benchmark name -> seconds per call
+    :type results: dict
+    :returns: None
+
+    """
+    width = max(len(name) for name in results)
+    for name, seconds in results.items():
+        print('{}  {:>12.3f} us'.format(name.ljust(width), seconds * 1e6))
+    return
@@ -14,8 +14,6 @@
 ##       Library imports         ##
 ###################################
 
-from json import JSONDecodeError
-from pprint import pprint
 from time import sleep
 
 import krakenex
@@ -54,13 +52,14 @@ while True:
         print('')
         break
 
-# Expecting streamed binary response when query successful.
-try:
-    response = kraken.query_private('RetrieveExport', {'id': report_id})
-except JSONDecodeError:
-    export_bytes = kraken.response.content
-    with open('ledgers.csv.zip', 'wb') as fd:
-        fd.write(export_bytes)
-    print('Done! Written as: ledgers.csv.zip')
-else:
-    pprint(response)
+# Streamed to disk in chunks; raises `krakenex.KrakenError` on failure.
+kraken.download_export(report_id, 'ledgers.csv.zip')
+print('Done! Written as: ledgers.csv.zip')
+
+# For several reports at once, `krakenex.Exports` requests them, waits,
+# downloads, checks and removes them:
+#
+# exports = krakenex.Exports(kraken)
+# exports.add('ledgers')
+# exports.add('trades')
+# exports.run('.')
@@ -37,5 +37,23 @@ to the top-level namespace, so the following uses are possible:
 """
 
 # "public interface"
+from . import decoders, frames, metrics
 from .api import API
-__all__ = ['API']
+from .asyncapi import AsyncAPI
+from .backfill import Backfill
+from .book import OrderBook
+from .cache import ResponseCache, SingleFlight
+from .errors import ChecksumError, KrakenError, RateLimitError
+from .export import Exports
+from .http2 import HTTP2Adapter
+from .nonce import NonceCounter, SharedNonceCounter
+from .pool import APIPool
+from .ratelimit import CallCounter, OrderThrottle
+from .replay import Recorder, Replayer
+from .store import Store
+from .ws import PrivateWebSocket, WebSocket
+__all__ = ['API', 'APIPool', 'AsyncAPI', 'Backfill', 'CallCounter',
+           'ChecksumError', 'Exports', 'HTTP2Adapter', 'KrakenError',
+           'NonceCounter', 'OrderBook', 'OrderThrottle', 'PrivateWebSocket',
+           'RateLimitError', 'Recorder', 'Replayer', 'ResponseCache',
+           'SharedNonceCounter', 'SingleFlight', 'Store', 'WebSocket']
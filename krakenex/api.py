@@ -18,19 +18,30 @@
 """Kraken.com cryptocurrency Exchange API."""
 
 import requests
+import requests.adapters
 
-# private query nonce
+# keep-alive, metrics
 import time
 
-# private query signing
+# concurrent queries, keep-alive
+import concurrent.futures
+import threading
+
+# export downloads
+import json
+import shutil
+
+# request body size, for metrics
 import urllib.parse
-import hashlib
-import hmac
-import base64
 
 from . import version
+from .base import _BaseAPI, _Pages
+from .cache import querykey
+from .errors import KrakenError
+from .http2 import HTTP2Adapter
+from .metrics import Sample, emit
 
-class API(object):
+class API(_BaseAPI):
     """ Maintains a single session between this machine and Kraken.
 
     Specifying a key/secret pair is optional. If not specified, private
@@ -43,8 +54,39 @@ class API(object):
     as attribute :py:attr:`response` of this object. It is overwritten
     on each query.
 
-    .. note::
-       No query rate limiting is performed.
+    The :py:attr:`limiter` attribute is ``None`` by default, and no
+    query rate limiting is performed. Set it to a
+    :py:class:`krakenex.CallCounter` to have private queries delayed
+    just long enough to stay under the API call counter limit.
+    Likewise, set :py:attr:`order_limiter` to a
+    :py:class:`krakenex.OrderThrottle` to keep order placement and
+    cancellation under the per-pair matching engine limit.
+
+    Public query responses can be cached by setting the :py:attr:`cache`
+    attribute to a :py:class:`krakenex.ResponseCache`. It is ``None`` by
+    default. Cache hits do not update :py:attr:`response`. Similarly,
+    identical public queries made at the same time from several threads
+    can share one network round trip, by setting the :py:attr:`coalescer`
+    attribute to a :py:class:`krakenex.SingleFlight`.
+
+    Nonces for private queries come from the :py:attr:`nonce` attribute,
+    a :py:class:`krakenex.NonceCounter` by default. It can be replaced
+    with any callable that returns an always-increasing integer, such as
+    a :py:class:`krakenex.SharedNonceCounter` when several processes use
+    the same key.
+
+    Nonce sources are thread-safe, but that only orders the nonces as
+    they are handed out, not as they reach Kraken. Private queries sent
+    at once on one key, from several threads or processes, can arrive
+    out of order; without a nonce window set for the key, Kraken refuses
+    the late ones with ``EAPI:Invalid nonce``. Set a nonce window for
+    keys used like that, or send the private queries one at a time, as
+    :py:meth:`query_many` does.
+
+    Set the :py:attr:`metrics` attribute to a function, such as a
+    :py:class:`krakenex.metrics.Histogram`, to have it called with a
+    :py:class:`krakenex.metrics.Sample` of timings and sizes after every
+    query that goes over the network. It is ``None`` by default.
 
     """
     def __init__(self, key='', secret=''):
@@ -57,53 +99,156 @@ class API(object):
         :returns: None
 
         """
-        self.key = key
-        self.secret = secret
-        self.uri = 'https://api.kraken.com'
-        self.apiversion = '0'
+        super(API, self).__init__(key, secret)
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'krakenex/' + version.__version__ + ' (+' + version.__url__ + ')'
+            'User-Agent': version.__useragent__
         })
-        self.response = None
-        self._json_options = {}
+        # set to stop the keep-alive thread
+        self._keepalive = None
+        self._last_sent = time.monotonic()
         return
 
-    def json_options(self, **kwargs):
-        """ Set keyword arguments to be passed to JSON deserialization.
-
-        :param kwargs: passed to :py:meth:`requests.Response.json`
+    def connection_pool(self, size=10, block=False, http2=False):
+        """ Replace the session's connection pool.
+
+        By default, :py:mod:`requests` keeps up to 10 connections to a
+        host; more queries at once than that open extra connections,
+        which are closed afterwards.
+
+        :param size: (optional) connections to keep open
+        :type size: int
+        :param block: (optional) if ``True``, queries wait for a pooled
+                      connection instead of opening extra ones
+        :type block: bool
+        :param http2: (optional) if ``True``, use a
+                      :py:class:`krakenex.HTTP2Adapter` instead, which
+                      carries many queries at once over each connection
+        :type http2: bool
         :returns: this instance for chaining
 
         """
-        self._json_options = kwargs
+        if http2:
+            adapter = HTTP2Adapter(max_connections = size)
+        else:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections = size, pool_maxsize = size,
+                pool_block = block
+            )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         return self
 
-    def close(self):
-        """ Close this session.
+    def warmup(self, connections=1, timeout=None):
+        """ Open connections ahead of the first queries.
+
+        Makes ``connections`` ``Time`` queries at once, each holding its
+        connection until all have been answered, so that as many
+        connections are opened (including the TLS handshake) and left in
+        the session's pool. A full round trip, rather than just
+        connecting, also reads what the server sends after the handshake,
+        such as TLS 1.3 session tickets; a pooled connection with unread
+        data is taken for dropped, and replaced, by the next query.
+
+        :param connections: (optional) how many to open; no more than
+                            the pool keeps
+        :type connections: int
+        :param timeout: (optional) seconds to wait for each query
+        :type timeout: int or float
+        :returns: None
 
+        """
+        adapter = self.session.get_adapter(self.uri)
+        count = connections
+        if isinstance(adapter, requests.adapters.HTTPAdapter):
+            count = min(count, adapter._pool_maxsize)
+        if count <= 0:
+            return
+
+        held = threading.Barrier(count)
+
+        def ping(_):
+            try:
+                self._ping(timeout, held)
+            except BaseException:
+                # do not leave the others waiting
+                held.abort()
+                raise
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = count) as pool:
+            list(pool.map(ping, range(count)))
+        return
+
+    def keepalive(self, interval=30.0):
+        """ Keep a connection open while idle, by querying ``Time``.
+
+        A thread queries ``Time`` whenever no query has been sent for
+        ``interval`` seconds, so the next query does not have to
+        reconnect. Servers close idle connections after a while; keep
+        ``interval`` below that.
+
+        :param interval: (optional) idle seconds between pings, or
+                         ``None`` to stop
+        :type interval: int or float
         :returns: None
 
         """
-        self.session.close()
+        if self._keepalive is not None:
+            self._keepalive.set()
+            self._keepalive = None
+        if interval is None:
+            return
+
+        stop = threading.Event()
+        self._keepalive = stop
+
+        def ping():
+            while not stop.wait(self._last_sent + interval - time.monotonic()):
+                if time.monotonic() - self._last_sent < interval:
+                    continue
+                try:
+                    self._ping(interval)
+                except requests.RequestException:
+                    # try again after another interval
+                    pass
+
+        threading.Thread(target = ping, daemon = True).start()
         return
 
-    def load_key(self, path):
-        """ Load key and secret from file.
+    def _ping(self, timeout, held=None):
+        """ Query ``Time``, without touching :py:attr:`response`.
 
-        Expected file format is key and secret on separate lines.
+        :param timeout: passed to :py:mod:`requests`
+        :type timeout: int or float
+        :param held: (optional) barrier to wait at before releasing the
+                     connection
+        :type held: :py:class:`threading.Barrier`
+        :returns: None
+
+        """
+        self._last_sent = time.monotonic()
+        url = self.uri + self._urlpath('public', 'Time')
+        response = self.session.get(url, timeout = timeout, stream = True)
+        try:
+            if held is not None:
+                held.wait(timeout)
+        finally:
+            # reading the body returns the connection to the pool
+            response.content
+        return
+
+    def close(self):
+        """ Close this session, and stop :py:meth:`keepalive`.
 
-        :param path: path to keyfile
-        :type path: str
         :returns: None
 
         """
-        with open(path, 'r') as f:
-            self.key = f.readline().strip()
-            self.secret = f.readline().strip()
+        self.keepalive(None)
+        self.session.close()
         return
 
-    def _query(self, urlpath, data, headers=None, timeout=None):
+    def _query(self, urlpath, data, headers=None, timeout=None, stream=False,
+               sign=0.0):
         """ Low-level query handling.
 
         .. note::
@@ -120,7 +265,14 @@ class API(object):
                         will be thrown after ``timeout`` seconds if a response
                         has not been received
         :type timeout: int or float
-        :returns: :py:meth:`requests.Response.json`-deserialised Python object
+        :param stream: (optional) if ``True``, return the response body
+                       as a file-like object instead of deserialising it;
+                       bypasses :py:attr:`cache` and :py:attr:`coalescer`
+        :type stream: bool
+        :param sign: (optional) seconds spent signing, for :py:attr:`metrics`
+        :type sign: float
+        :returns: :py:meth:`requests.Response.json`-deserialised Python object,
+                  or :py:attr:`requests.Response.raw` if streaming
         :raises: :py:exc:`requests.HTTPError`: if response status not successful
 
         """
@@ -129,25 +281,144 @@ class API(object):
         if headers is None:
             headers = {}
 
-        url = self.uri + urlpath
+        if stream:
+            return self._send(urlpath, data, headers, timeout, stream = True,
+                              sign = sign)
 
-        # Since 2024-01-31, public endpoints only support GET.
-        if '/public/' in urlpath:
-            self.response = self.session.get(
-                url, params = data, headers = headers, timeout = timeout
-            )
-        else: 
-            self.response = self.session.post(
-                url, data = data, headers = headers, timeout = timeout
+        public = '/public/' in urlpath
+
+        if public and self.cache is not None:
+            cached = self.cache.get(urlpath, data)
+            if cached is not None:
+                return cached
+
+        if public and self.coalescer is not None:
+            response = self.coalescer.call(
+                querykey(urlpath, data),
+                lambda: self._send(urlpath, data, headers, timeout)
             )
+        else:
+            response = self._send(urlpath, data, headers, timeout, sign = sign)
 
-        if self.response.status_code not in (200, 201, 202):
-            self.response.raise_for_status()
+        if public and self.cache is not None:
+            self.cache.put(urlpath, data, response)
 
-        return self.response.json(**self._json_options)
+        return response
 
+    def _send(self, urlpath, data, headers, timeout, stream=False, sign=0.0):
+        """ Send a query over the network.
 
-    def query_public(self, method, data=None, timeout=None):
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param data: API request parameters
+        :type data: dict
+        :param headers: HTTPS headers
+        :type headers: dict
+        :param timeout: passed to :py:mod:`requests`
+        :type timeout: int or float
+        :param stream: (optional) if ``True``, do not read the body
+        :type stream: bool
+        :param sign: (optional) seconds spent signing, for :py:attr:`metrics`
+        :type sign: float
+        :returns: :py:meth:`requests.Response.json`-deserialised Python object,
+                  or :py:attr:`requests.Response.raw` if streaming
+        :raises: :py:exc:`requests.HTTPError`: if response status not successful
+
+        """
+        url = self.uri + urlpath
+        self._last_sent = time.monotonic()
+
+        measure = self.metrics is not None
+        if measure:
+            start = time.time()
+            began = time.perf_counter()
+
+        # Since 2024-01-31, public endpoints only support GET.
+        try:
+            if '/public/' in urlpath:
+                response = self.session.get(
+                    url, params = data, headers = headers, timeout = timeout,
+                    stream = stream
+                )
+            else:
+                response = self.session.post(
+                    url, data = data, headers = headers, timeout = timeout,
+                    stream = stream
+                )
+        except requests.RequestException as e:
+            if measure:
+                sent = 0
+                if '/public/' not in urlpath:
+                    sent = len(urllib.parse.urlencode(data))
+                self._measure_failure(urlpath, e, sign, start, began, sent)
+            raise
+        self.response = response
+
+        if measure:
+            received = time.perf_counter()
+
+        if response.status_code not in (200, 201, 202):
+            if measure:
+                self._measure(urlpath, response, None, stream, sign, start,
+                              began, received)
+            response.raise_for_status()
+
+        if stream:
+            if measure:
+                self._measure(urlpath, response, None, stream, sign, start,
+                              began, received)
+            # undo any transfer compression while reading
+            response.raw.decode_content = True
+            return response.raw
+
+        if self._json_decoder is not None:
+            result = self._json_decoder(response.content)
+        else:
+            result = response.json(**self._json_options)
+
+        if measure:
+            self._measure(urlpath, response, result, stream, sign, start,
+                          began, received)
+        return result
+
+    def _measure(self, urlpath, response, result, stream, sign, start, began,
+                 received):
+        """ Hand a query's measurements to :py:attr:`metrics`.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param response: response as received
+        :type response: :py:class:`requests.Response`
+        :param result: deserialised response, or ``None``
+        :param stream: whether the body was left unread
+        :type stream: bool
+        :param sign: seconds spent signing
+        :param start: :py:func:`time.time` when sent
+        :param began: :py:func:`time.perf_counter` when sent
+        :param received: :py:func:`time.perf_counter` when the body (or
+                         just the headers, if streaming) had been read
+        :returns: None
+
+        """
+        decoded = time.perf_counter()
+        request = response.elapsed.total_seconds()
+        body = response.request.body
+        errors = result.get('error', []) if isinstance(result, dict) else []
+        kind, method = urlpath.split('/')[-2:]
+
+        emit(self.metrics, Sample(
+            method = method, kind = kind, status = response.status_code,
+            errors = tuple(errors), start = start, sign = sign,
+            request = request,
+            download = max(0.0, received - began - request),
+            decode = decoded - received,
+            total = sign + decoded - began,
+            sent = len(body) if body else 0,
+            received = 0 if stream else len(response.content)
+        ))
+        return
+
+    def query_public(self, method, data=None, timeout=None, stream=False):
         """ Performs an API query that does not require a valid key/secret pair.
 
         :param method: API method name
@@ -158,17 +429,22 @@ class API(object):
                         will be thrown after ``timeout`` seconds if a response
                         has not been received
         :type timeout: int or float
-        :returns: :py:meth:`requests.Response.json`-deserialised Python object
+        :param stream: (optional) if ``True``, return the response body as a
+                       file-like object, without reading or deserialising it;
+                       close it when done
+        :type stream: bool
+        :returns: :py:meth:`requests.Response.json`-deserialised Python object,
+                  or :py:attr:`requests.Response.raw` if streaming
 
         """
         if data is None:
             data = {}
 
-        urlpath = '/' + self.apiversion + '/public/' + method
+        urlpath = self._urlpath('public', method)
 
-        return self._query(urlpath, data, timeout = timeout)
+        return self._query(urlpath, data, timeout = timeout, stream = stream)
 
-    def query_private(self, method, data=None, timeout=None):
+    def query_private(self, method, data=None, timeout=None, stream=False):
         """ Performs an API query that requires a valid key/secret pair.
 
         :param method: API method name
@@ -179,7 +455,14 @@ class API(object):
                         will be thrown after ``timeout`` seconds if a response
                         has not been received
         :type timeout: int or float
-        :returns: :py:meth:`requests.Response.json`-deserialised Python object
+        :param stream: (optional) if ``True``, return the response body as a
+                       file-like object, without reading or deserialising it;
+                       close it when done
+        :type stream: bool
+        :returns: :py:meth:`requests.Response.json`-deserialised Python object,
+                  or :py:attr:`requests.Response.raw` if streaming
+        :raises: :py:exc:`krakenex.RateLimitError`: if refused by
+                 :py:attr:`order_limiter`
 
         """
         if data is None:
@@ -188,42 +471,162 @@ class API(object):
         if not self.key or not self.secret:
             raise Exception('Either key or secret is not set! (Use `load_key()`.')
 
-        data['nonce'] = self._nonce()
+        if self.limiter is not None:
+            time.sleep(self.limiter.reserve(method))
+        if self.order_limiter is not None:
+            time.sleep(self.order_limiter.reserve(method, data))
 
-        urlpath = '/' + self.apiversion + '/private/' + method
+        began = time.perf_counter()
+        urlpath, headers = self._private(method, data)
+        sign = time.perf_counter() - began
 
-        headers = {
-            'API-Key': self.key,
-            'API-Sign': self._sign(data, urlpath)
-        }
+        response = self._query(urlpath, data, headers, timeout = timeout,
+                               stream = stream, sign = sign)
 
-        return self._query(urlpath, data, headers, timeout = timeout)
+        if self.order_limiter is not None:
+            self.order_limiter.record(method, data, response)
 
-    def _nonce(self):
-        """ Nonce counter.
+        return response
 
-        :returns: an always-increasing unsigned integer (up to 64 bits wide)
+    def query_many(self, queries, workers=4, timeout=None, ordered=True):
+        """ Performs several API queries concurrently.
 
-        """
-        return int(1000*time.time())
+        Each query is a tuple of ``(kind, method)`` or
+        ``(kind, method, data)``, where ``kind`` is ``'public'`` or
+        ``'private'``, and the rest is as for :py:meth:`query_public`
+        or :py:meth:`query_private`.
 
-    def _sign(self, data, urlpath):
-        """ Sign request data according to Kraken's scheme.
+        Queries share this object's session. Public queries run
+        concurrently. Private queries run one after another, in input
+        order, alongside the public ones: each gets its nonce only once
+        the one before has been answered, so Kraken sees strictly
+        increasing nonces even with a nonce window of 0.
+
+        .. note::
+           :py:attr:`response` is left holding whichever response
+           arrived last.
+
+        :param queries: queries to perform
+        :type queries: iterable
+        :param workers: (optional) maximum number of queries in flight
+        :type workers: int
+        :param timeout: (optional) passed to each query
+        :type timeout: int or float
+        :param ordered: (optional) if ``False``, private queries run
+                        concurrently too, and may reach Kraken out of
+                        nonce order; only for keys with a nonce window
+        :type ordered: bool
+        :returns: one ``(response, exception)`` tuple per query, in input
+                  order; ``exception`` is ``None`` if the query succeeded,
+                  otherwise ``response`` is ``None``
+        :rtype: list
 
-        :param data: API request parameters
-        :type data: dict
-        :param urlpath: API URL path sans host
-        :type urlpath: str
-        :returns: signature digest
         """
-        postdata = urllib.parse.urlencode(data)
+        queries = list(queries)
+        results = [None] * len(queries)
+
+        def perform(index):
+            query = queries[index]
+            kind, method = query[0], query[1]
+            data = query[2] if len(query) > 2 else None
+            try:
+                if kind == 'public':
+                    response = self.query_public(method, data, timeout = timeout)
+                elif kind == 'private':
+                    response = self.query_private(method, data, timeout = timeout)
+                else:
+                    raise ValueError('Unknown query kind: ' + str(kind))
+            except Exception as e:
+                results[index] = (None, e)
+            else:
+                results[index] = (response, None)
+
+        lane = []
+        if ordered:
+            lane = [index for index, query in enumerate(queries)
+                    if query[0] == 'private']
+        others = [index for index, query in enumerate(queries)
+                  if not (ordered and query[0] == 'private')]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+            if lane:
+                pool.submit(lambda: [perform(index) for index in lane])
+            for index in others:
+                pool.submit(perform, index)
+
+        return results
+
+    def _paginate(self, method, field, timefield, start, end, data):
+        """ Page through a private history method, newest first.
+
+        Each page is a private query, so is subject to :py:attr:`limiter`.
+
+        :param method: API method name
+        :type method: str
+        :param field: result field holding entries by ID
+        :type field: str
+        :param timefield: entry field holding its time
+        :type timefield: str
+        :param start: earliest time (exclusive), or ``None``
+        :param end: latest time (inclusive), or ``None``
+        :param data: other request parameters
+        :type data: dict
+        :returns: generator of ``(id, entry)`` tuples
 
-        # Unicode-objects must be encoded before hashing
-        encoded = (str(data['nonce']) + postdata).encode()
-        message = urlpath.encode() + hashlib.sha256(encoded).digest()
+        """
+        pages = _Pages(field, timefield, start, end, data)
+        while True:
+            query = pages.next_query()
+            if query is None:
+                return
+            for entry in pages.feed(self.query_private(method, query)):
+                yield entry
+
+    def download_export(self, id, path, chunk_size=1048576):
+        """ Download a finished export report to a file.
+
+        The report is streamed to disk in chunks, rather than held in
+        memory; exports can be hundreds of megabytes.
+
+        :param id: report ID, as returned by ``AddExport``
+        :type id: str
+        :param path: file to write the report (a ZIP archive) to
+        :type path: str
+        :param chunk_size: (optional) bytes to read and write at a time
+        :type chunk_size: int
+        :returns: ``path``
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors instead of the report
 
-        signature = hmac.new(base64.b64decode(self.secret),
-                             message, hashlib.sha512)
-        sigdigest = base64.b64encode(signature.digest())
+        """
+        body = self.query_private('RetrieveExport', {'id': id}, stream=True)
+        # not self.response, which another thread may have replaced
+        try:
+            # errors come back as JSON, the report as application/zip
+            if 'json' in body.headers.get('Content-Type', ''):
+                response = json.loads(body.read().decode())
+                raise KrakenError(response['error'])
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(body, f, chunk_size)
+        finally:
+            body.close()
+        return path
+
+    def websockets_token(self):
+        """ Get a token for the authenticated WebSocket API.
+
+        Tokens are fetched with the ``GetWebSocketsToken`` private method,
+        and reused until shortly before they expire.
+
+        :returns: token
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken refused a token
 
-        return sigdigest.decode()
+        """
+        token = self._cached_websockets_token()
+        if token is None:
+            token = self._store_websockets_token(
+                self.query_private('GetWebSocketsToken')
+            )
+        return token
@@ -0,0 +1,449 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Kraken.com cryptocurrency Exchange API, :py:mod:`asyncio` flavour."""
+
+import asyncio
+import json
+import time
+import urllib.parse
+
+from . import version
+from .base import _BaseAPI, _Pages
+from .cache import querykey
+from .errors import KrakenError
+from .metrics import Sample, emit
+
+class AsyncAPI(_BaseAPI):
+    """ Maintains a pool of connections between this machine and Kraken.
+
+    Behaves like :py:class:`krakenex.API`, but :py:meth:`query_public`
+    and :py:meth:`query_private` are coroutines, so many queries can be
+    in flight on a single event loop. Authentication, nonce generation,
+    request signing, JSON options and the :py:attr:`limiter`,
+    :py:attr:`order_limiter`, :py:attr:`cache`, :py:attr:`coalescer` and
+    :py:attr:`metrics` attributes are shared with :py:class:`krakenex.API`.
+
+    Requires :py:mod:`aiohttp`, which is not installed by default.
+
+    The :py:attr:`session` attribute is an :py:class:`aiohttp.ClientSession`
+    object. It is created on first query, since it must be bound to a
+    running event loop, and is ``None`` until then.
+
+    Query responses, as received by :py:mod:`aiohttp`, are retained
+    as attribute :py:attr:`response` of this object. It is overwritten
+    on each query, and its body has already been read.
+
+    :py:meth:`query_many`, :py:meth:`download_export` and
+    :py:meth:`websockets_token` are coroutines too, and
+    :py:meth:`iter_trades_history`, :py:meth:`iter_ledgers` and
+    :py:meth:`iter_closed_orders` return asynchronous generators. The
+    pool size is set by ``connections`` when creating the object;
+    :py:mod:`aiohttp` manages the connections itself, so there is no
+    ``connection_pool``, ``warmup`` or ``keepalive``.
+
+    """
+    def __init__(self, key='', secret='', connections=100):
+        """ Create an object with authentication information.
+
+        :param key: (optional) key identifier for queries to the API
+        :type key: str
+        :param secret: (optional) actual private key used to sign messages
+        :type secret: str
+        :param connections: (optional) maximum number of simultaneous
+                            connections to keep in the pool
+        :type connections: int
+        :returns: None
+
+        """
+        super(AsyncAPI, self).__init__(key, secret)
+        # created on first query
+        self.session = None
+        self.connections = connections
+        return
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+        return
+
+    async def close(self):
+        """ Close this session.
+
+        :returns: None
+
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        return
+
+    def _session(self):
+        """ Get the HTTP session, creating it if necessary.
+
+        :returns: :py:class:`aiohttp.ClientSession`
+
+        """
+        if self.session is None:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.connections)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': version.__useragent__}
+            )
+        return self.session
+
+    async def _query(self, urlpath, data, headers=None, timeout=None, sign=0.0):
+        """ Low-level query handling.
+
+        .. note::
+           Use :py:meth:`query_private` or :py:meth:`query_public`
+           unless you have a good reason not to.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param data: API request parameters
+        :type data: dict
+        :param headers: (optional) HTTPS headers
+        :type headers: dict
+        :param timeout: (optional) if not ``None``, a :py:exc:`asyncio.TimeoutError`
+                        will be thrown after ``timeout`` seconds if a response
+                        has not been received
+        :type timeout: int or float
+        :param sign: (optional) seconds spent signing, for :py:attr:`metrics`
+        :type sign: float
+        :returns: :py:func:`json.loads`-deserialised Python object
+        :raises: :py:exc:`aiohttp.ClientResponseError`: if response status
+                 not successful
+
+        """
+        if data is None:
+            data = {}
+        if headers is None:
+            headers = {}
+
+        public = '/public/' in urlpath
+
+        if public and self.cache is not None:
+            cached = self.cache.get(urlpath, data)
+            if cached is not None:
+                return cached
+
+        if public and self.coalescer is not None:
+            response = await self.coalescer.acall(
+                querykey(urlpath, data),
+                lambda: self._send(urlpath, data, headers, timeout)
+            )
+        else:
+            response = await self._send(urlpath, data, headers, timeout,
+                                        sign=sign)
+
+        if public and self.cache is not None:
+            self.cache.put(urlpath, data, response)
+
+        return response
+
+    async def _send(self, urlpath, data, headers, timeout, sign=0.0):
+        """ Send a query over the network.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param data: API request parameters
+        :type data: dict
+        :param headers: HTTPS headers
+        :type headers: dict
+        :param timeout: total seconds to wait for a response, if not ``None``
+        :type timeout: int or float
+        :param sign: (optional) seconds spent signing, for :py:attr:`metrics`
+        :type sign: float
+        :returns: :py:func:`json.loads`-deserialised Python object
+        :raises: :py:exc:`aiohttp.ClientResponseError`: if response status
+                 not successful
+
+        """
+        import aiohttp
+
+        session = self._session()
+        url = self.uri + urlpath
+
+        kwargs = {'headers': headers}
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+
+        measure = self.metrics is not None
+        if measure:
+            start = time.time()
+            began = time.perf_counter()
+
+        # Since 2024-01-31, public endpoints only support GET.
+        if '/public/' in urlpath:
+            postdata = ''
+            request = session.get(url, params=data, **kwargs)
+        else:
+            # must be byte-for-byte what was signed
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            postdata = urllib.parse.urlencode(data)
+            request = session.post(url, data=postdata, **kwargs)
+
+        try:
+            async with request as response:
+                self.response = response
+                if measure:
+                    arrived = time.perf_counter()
+                body = await response.read()
+                if measure:
+                    received = time.perf_counter()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if measure:
+                self._measure_failure(urlpath, e, sign, start, began,
+                                      len(postdata))
+            raise
+
+        if response.status not in (200, 201, 202):
+            if measure:
+                self._measure_async(urlpath, response.status, None, sign,
+                                    start, began, arrived, received,
+                                    len(postdata), len(body))
+            response.raise_for_status()
+
+        if self._json_decoder is not None:
+            result = self._json_decoder(body)
+        else:
+            result = json.loads(body.decode(), **self._json_options)
+
+        if measure:
+            self._measure_async(urlpath, response.status, result, sign, start,
+                                began, arrived, received, len(postdata),
+                                len(body))
+        return result
+
+    def _measure_async(self, urlpath, status, result, sign, start, began,
+                       arrived, received, sent, size):
+        """ Hand a query's measurements to :py:attr:`metrics`.
+
+        Times are from :py:func:`time.perf_counter`, except ``start``,
+        which is from :py:func:`time.time`; ``arrived`` is when the
+        response headers had been read.
+
+        :returns: None
+
+        """
+        decoded = time.perf_counter()
+        errors = result.get('error', []) if isinstance(result, dict) else []
+        kind, method = urlpath.split('/')[-2:]
+
+        emit(self.metrics, Sample(
+            method=method, kind=kind, status=status, errors=tuple(errors),
+            start=start, sign=sign, request=arrived - began,
+            download=received - arrived, decode=decoded - received,
+            total=sign + decoded - began, sent=sent, received=size
+        ))
+        return
+
+    async def query_public(self, method, data=None, timeout=None):
+        """ Performs an API query that does not require a valid key/secret pair.
+
+        :param method: API method name
+        :type method: str
+        :param data: (optional) API request parameters
+        :type data: dict
+        :param timeout: (optional) if not ``None``, a :py:exc:`asyncio.TimeoutError`
+                        will be thrown after ``timeout`` seconds if a response
+                        has not been received
+        :type timeout: int or float
+        :returns: :py:func:`json.loads`-deserialised Python object
+
+        """
+        if data is None:
+            data = {}
+
+        urlpath = self._urlpath('public', method)
+
+        return await self._query(urlpath, data, timeout=timeout)
+
+    async def query_private(self, method, data=None, timeout=None):
+        """ Performs an API query that requires a valid key/secret pair.
+
+        :param method: API method name
+        :type method: str
+        :param data: (optional) API request parameters
+        :type data: dict
+        :param timeout: (optional) if not ``None``, a :py:exc:`asyncio.TimeoutError`
+                        will be thrown after ``timeout`` seconds if a response
+                        has not been received
+        :type timeout: int or float
+        :returns: :py:func:`json.loads`-deserialised Python object
+        :raises: :py:exc:`krakenex.RateLimitError`: if refused by
+                 :py:attr:`order_limiter`
+
+        """
+        if data is None:
+            data = {}
+
+        if not self.key or not self.secret:
+            raise Exception('Either key or secret is not set! (Use `load_key()`.')
+
+        if self.limiter is not None:
+            await asyncio.sleep(self.limiter.reserve(method))
+        if self.order_limiter is not None:
+            await asyncio.sleep(self.order_limiter.reserve(method, data))
+
+        began = time.perf_counter()
+        urlpath, headers = self._private(method, data)
+        sign = time.perf_counter() - began
+
+        response = await self._query(urlpath, data, headers, timeout=timeout,
+                                     sign=sign)
+
+        if self.order_limiter is not None:
+            self.order_limiter.record(method, data, response)
+
+        return response
+
+    async def websockets_token(self):
+        """ Get a token for the authenticated WebSocket API.
+
+        Tokens are fetched with the ``GetWebSocketsToken`` private method,
+        and reused until shortly before they expire.
+
+        :returns: token
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken refused a token
+
+        """
+        token = self._cached_websockets_token()
+        if token is None:
+            token = self._store_websockets_token(
+                await self.query_private('GetWebSocketsToken')
+            )
+        return token
+
+    async def query_many(self, queries, workers=4, timeout=None, ordered=True):
+        """ Performs several API queries concurrently.
+
+        As :py:meth:`krakenex.API.query_many`: public queries run
+        concurrently, and private ones one after another, in input order,
+        unless ``ordered`` is ``False``.
+
+        :param queries: ``(kind, method)`` or ``(kind, method, data)``
+                        tuples
+        :type queries: iterable
+        :param workers: (optional) maximum number of queries in flight
+        :type workers: int
+        :param timeout: (optional) passed to each query
+        :type timeout: int or float
+        :param ordered: (optional) if ``False``, private queries run
+                        concurrently too; only for keys with a nonce window
+        :type ordered: bool
+        :returns: one ``(response, exception)`` tuple per query, in input
+                  order
+        :rtype: list
+
+        """
+        queries = list(queries)
+        results = [None] * len(queries)
+        slots = asyncio.Semaphore(workers)
+
+        async def perform(index):
+            query = queries[index]
+            kind, method = query[0], query[1]
+            data = query[2] if len(query) > 2 else None
+            try:
+                async with slots:
+                    if kind == 'public':
+                        response = await self.query_public(method, data,
+                                                           timeout=timeout)
+                    elif kind == 'private':
+                        response = await self.query_private(method, data,
+                                                            timeout=timeout)
+                    else:
+                        raise ValueError('Unknown query kind: ' + str(kind))
+            except Exception as e:
+                results[index] = (None, e)
+            else:
+                results[index] = (response, None)
+
+        async def lane(indices):
+            for index in indices:
+                await perform(index)
+
+        private = [index for index, query in enumerate(queries)
+                   if ordered and query[0] == 'private']
+        others = [index for index, query in enumerate(queries)
+                  if not (ordered and query[0] == 'private')]
+        await asyncio.gather(lane(private), *[perform(index) for index in others])
+        return results
+
+    async def _paginate(self, method, field, timefield, start, end, data):
+        """ Page through a private history method, newest first.
+
+        :returns: asynchronous generator of ``(id, entry)`` tuples
+
+        """
+        pages = _Pages(field, timefield, start, end, data)
+        while True:
+            query = pages.next_query()
+            if query is None:
+                return
+            for entry in pages.feed(await self.query_private(method, query)):
+                yield entry
+
+    async def download_export(self, id, path, chunk_size=1048576):
+        """ Download a finished export report to a file.
+
+        As :py:meth:`krakenex.API.download_export`: the report is
+        streamed to disk in chunks, rather than held in memory.
+
+        :param id: report ID, as returned by ``AddExport``
+        :type id: str
+        :param path: file to write the report (a ZIP archive) to
+        :type path: str
+        :param chunk_size: (optional) bytes to read and write at a time
+        :type chunk_size: int
+        :returns: ``path``
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors instead of the report
+        :raises: :py:exc:`aiohttp.ClientResponseError`: if response status
+                 not successful
+
+        """
+        if not self.key or not self.secret:
+            raise Exception('Either key or secret is not set! (Use `load_key()`.')
+
+        if self.limiter is not None:
+            await asyncio.sleep(self.limiter.reserve('RetrieveExport'))
+
+        data = {'id': id}
+        urlpath, headers = self._private('RetrieveExport', data)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        session = self._session()
+        async with session.post(self.uri + urlpath,
+                                data=urllib.parse.urlencode(data),
+                                headers=headers) as response:
+            self.response = response
+            response.raise_for_status()
+            # errors come back as JSON, the report as application/zip
+            if 'json' in response.headers.get('Content-Type', ''):
+                raise KrakenError(json.loads(await response.read())['error'])
+            with open(path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+        return path
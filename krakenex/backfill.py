@@ -0,0 +1,187 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Parallel backfill of public trade history."""
+
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+from .errors import KrakenError
+
+class Backfill(object):
+    """ Fetches public ``Trades`` history for a time range, in parallel.
+
+    The range is split into equal time slices, which are fetched
+    concurrently. Each slice pages forward with the ``last`` cursor
+    from its own start until it reaches the next slice's start; trades
+    are assigned to exactly one slice by their time, so the slices
+    join up without gaps or duplicates.
+
+    Progress can be checkpointed to a file after every page, and picked
+    up from there by a new :py:class:`Backfill` with the same arguments.
+    Pages are handed to the callback before the checkpoint is written,
+    so after a crash at most one page per slice is handed over again.
+
+    Kraken limits public queries per IP address, not per key; pass a
+    :py:class:`krakenex.CallCounter` with suitable ``maximum`` and
+    ``decay`` as ``limiter`` to stay under it. Queries refused for
+    exceeding the limit are retried after a pause.
+
+    """
+    #: trades requested per page
+    COUNT = 1000
+
+    #: seconds to pause after a query is refused for exceeding the limit
+    PAUSE = 5
+
+    def __init__(self, api, pair, start, end, slices=8, workers=4,
+                 checkpoint=None, limiter=None):
+        """ Plan a backfill.
+
+        :param api: used to query ``Trades``
+        :type api: krakenex.API
+        :param pair: asset pair
+        :type pair: str
+        :param start: earliest time (inclusive), in seconds since the epoch
+        :type start: int or float
+        :param end: latest time (exclusive), in seconds since the epoch
+        :type end: int or float
+        :param slices: (optional) number of time slices
+        :type slices: int
+        :param workers: (optional) maximum number of queries in flight
+        :type workers: int
+        :param checkpoint: (optional) path of checkpoint file
+        :type checkpoint: str
+        :param limiter: (optional) public query rate limiter
+        :type limiter: krakenex.CallCounter
+        :returns: None
+        :raises: :py:exc:`ValueError`: if an existing checkpoint is for a
+                 different backfill
+
+        """
+        self.api = api
+        self.pair = pair
+        self.start = start
+        self.end = end
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.limiter = limiter
+        self._lock = threading.Lock()
+
+        step = (end - start) / slices
+        bounds = [start + i * step for i in range(slices)] + [end]
+        # [slice start, slice end, cursor, done]
+        self.slices = [[bounds[i], bounds[i + 1], self._since(bounds[i]), False]
+                       for i in range(slices)]
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                saved = json.load(f)
+            if saved['pair'] != pair or \
+               [s[:2] for s in saved['slices']] != [s[:2] for s in self.slices]:
+                raise ValueError('Checkpoint {} is for a different backfill'
+                                 .format(checkpoint))
+            self.slices = saved['slices']
+        return
+
+    @staticmethod
+    def _since(t):
+        # nanoseconds, a microsecond early so nothing at `t` is missed
+        return str(int(t * 1000000000) - 1000)
+
+    def _save(self):
+        """ Write the checkpoint, atomically. Called with the lock held. """
+        if self.checkpoint is None:
+            return
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'pair': self.pair, 'slices': self.slices}, f)
+        os.replace(temporary, self.checkpoint)
+        return
+
+    def _page(self, since):
+        """ Query one page of trades.
+
+        :returns: trades, and cursor for the next page
+        :rtype: tuple
+
+        """
+        while True:
+            if self.limiter is not None:
+                time.sleep(self.limiter.reserve('Trades'))
+            response = self.api.query_public('Trades', {'pair': self.pair,
+                                                        'since': since,
+                                                        'count': self.COUNT})
+            if 'EAPI:Rate limit exceeded' in response['error']:
+                time.sleep(self.PAUSE)
+                continue
+            if response['error']:
+                raise KrakenError(response['error'])
+            break
+
+        result = response['result']
+        last = result.pop('last')
+        # the only other key is Kraken's name for the pair
+        trades = next(iter(result.values()), [])
+        return trades, str(last)
+
+    def _fill(self, index, callback):
+        """ Fetch one slice to its end. """
+        first, last, since, done = self.slices[index]
+        while not done:
+            trades, cursor = self._page(since)
+            done = not trades or cursor == since or float(trades[-1][2]) >= last
+            keep = [t for t in trades if first <= float(t[2]) < last]
+
+            with self._lock:
+                if keep:
+                    callback(index, keep)
+                since = cursor
+                self.slices[index][2:] = [since, done]
+                self._save()
+        return
+
+    def run(self, callback):
+        """ Fetch all slices not yet done.
+
+        :param callback: called as ``callback(index, trades)`` with each
+                         page's trades, in time order within a slice;
+                         slices are numbered in time order. Calls are
+                         serialised, but slices are interleaved.
+        :type callback: callable
+        :returns: None
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors other than exceeding the rate limit
+
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._fill, index, callback)
+                       for index, s in enumerate(self.slices) if not s[3]]
+            for future in futures:
+                future.result()
+        return
+
+    def done(self):
+        """ Whether all slices have been fetched.
+
+        :rtype: bool
+
+        """
+        return all(s[3] for s in self.slices)
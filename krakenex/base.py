@@ -0,0 +1,421 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""What :py:class:`krakenex.API` and :py:class:`krakenex.AsyncAPI` share."""
+
+# websockets token expiry
+import time
+
+# private query signing
+import urllib.parse
+import hashlib
+import hmac
+import base64
+
+from .errors import KrakenError
+from .metrics import Sample, emit
+from .nonce import NonceCounter
+
+class _Pages(object):
+    """ Where paging through a private history method, newest first, is.
+
+    Pages are requested by moving ``end`` back to the oldest time seen
+    so far, rather than by offset, so entries added while paging do
+    not shift pages. Entries at exactly that time are requested
+    again, and skipped; only their IDs are remembered, so memory use
+    does not grow with the number of entries.
+
+    Holds no connection, so serves :py:class:`krakenex.API` and
+    :py:class:`krakenex.AsyncAPI` alike.
+
+    """
+    def __init__(self, field, timefield, start, end, data):
+        """ Start before the newest page.
+
+        :param field: result field holding entries by ID
+        :type field: str
+        :param timefield: entry field holding its time
+        :type timefield: str
+        :param start: earliest time (exclusive), or ``None``
+        :param end: latest time (inclusive), or ``None``
+        :param data: other request parameters
+        :type data: dict
+        :returns: None
+
+        """
+        self.field = field
+        self.timefield = timefield
+        self.data = dict(data)
+        if start is not None:
+            self.data['start'] = start
+        self.end = end
+        # IDs of entries at time `end` that were already yielded
+        self.boundary = set()
+        self.ofs = 0
+        self.done = False
+        return
+
+    def next_query(self):
+        """ Request parameters for the next page.
+
+        :returns: parameters, or ``None`` if there are no more pages
+        :rtype: dict
+
+        """
+        if self.done:
+            return None
+        query = dict(self.data, ofs = self.ofs)
+        if self.end is not None:
+            query['end'] = self.end
+        return query
+
+    def feed(self, response):
+        """ Take in the response to :py:meth:`next_query`.
+
+        :param response: deserialised query response
+        :type response: dict
+        :returns: ``(id, entry)`` tuples not yielded before, newest first
+        :rtype: list
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        if response['error']:
+            raise KrakenError(response['error'])
+        result = response['result']
+        entries = result[self.field]
+        if not entries:
+            self.done = True
+            return []
+
+        timefield = self.timefield
+        page = sorted(entries.items(), key = lambda item: item[1][timefield],
+                      reverse = True)
+        fresh = [(entryid, entry) for entryid, entry in page
+                 if entryid not in self.boundary]
+
+        if self.ofs + len(page) >= int(result['count']):
+            self.done = True
+            return fresh
+
+        oldest = page[-1][1][timefield]
+        if self.end is not None and float(oldest) == float(self.end):
+            # whole page at one time; only an offset gets past it
+            self.boundary.update(entryid for entryid, _ in page)
+            self.ofs += len(page)
+        else:
+            self.end = oldest
+            self.boundary = set(entryid for entryid, entry in page
+                                if entry[timefield] == oldest)
+            self.ofs = 0
+        return fresh
+
+class _BaseAPI(object):
+    """ Authentication, signing and options, without a connection.
+
+    Subclasses provide a session, ``_paginate``, and the queries
+    themselves; see :py:class:`krakenex.API` and
+    :py:class:`krakenex.AsyncAPI` for the attributes set here.
+
+    """
+    def __init__(self, key='', secret=''):
+        """ Create an object with authentication information.
+
+        :param key: (optional) key identifier for queries to the API
+        :type key: str
+        :param secret: (optional) actual private key used to sign messages
+        :type secret: str
+        :returns: None
+
+        """
+        self.key = key
+        self.secret = secret
+        self.uri = 'https://api.kraken.com'
+        self.apiversion = '0'
+        self.response = None
+        self.limiter = None
+        self.order_limiter = None
+        self.cache = None
+        self.coalescer = None
+        self.metrics = None
+        self._json_options = {}
+        self._json_decoder = None
+        self._websockets_token = None
+        # (secret, keyed HMAC to copy), for the secret it was made from
+        self._signer = None
+        # (API version, {kind: {method: URL path}})
+        self._urlpaths = None
+        self.nonce = NonceCounter()
+        return
+
+    def json_options(self, **kwargs):
+        """ Set keyword arguments to be passed to JSON deserialization.
+
+        :param kwargs: passed to :py:meth:`requests.Response.json`, or
+                       to :py:func:`json.loads` by
+                       :py:class:`krakenex.AsyncAPI`
+        :returns: this instance for chaining
+
+        """
+        self._json_options = kwargs
+        return self
+
+    def json_decoder(self, decoder):
+        """ Set a function to decode response bodies with.
+
+        Replaces :py:meth:`requests.Response.json` (or
+        :py:func:`json.loads`), so options set with
+        :py:meth:`json_options` are not used while it is set. See
+        :py:mod:`krakenex.decoders` for fast decoders, and for decoders
+        that convert numeric strings, at a cost.
+
+        :param decoder: function from :py:class:`bytes` to Python object,
+                        or ``None`` to restore the default
+        :type decoder: callable
+        :returns: this instance for chaining
+
+        """
+        self._json_decoder = decoder
+        return self
+
+    def load_key(self, path):
+        """ Load key and secret from file.
+
+        Expected file format is key and secret on separate lines.
+
+        :param path: path to keyfile
+        :type path: str
+        :returns: None
+
+        """
+        with open(path, 'r') as f:
+            self.key = f.readline().strip()
+            self.secret = f.readline().strip()
+        return
+
+    def _measure_failure(self, urlpath, exception, sign, start, began, sent):
+        """ Hand :py:attr:`metrics` a query that got no response.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param exception: raised instead of a response arriving
+        :type exception: Exception
+        :param sign: seconds spent signing
+        :param start: :py:func:`time.time` when sent
+        :param began: :py:func:`time.perf_counter` when sent
+        :param sent: request body size in bytes
+        :type sent: int
+        :returns: None
+
+        """
+        waited = time.perf_counter() - began
+        kind, method = urlpath.split('/')[-2:]
+
+        emit(self.metrics, Sample(
+            method = method, kind = kind, status = 0,
+            errors = (type(exception).__name__,), start = start, sign = sign,
+            request = waited, download = 0.0, decode = 0.0,
+            total = sign + waited, sent = sent, received = 0
+        ))
+        return
+
+    def _private(self, method, data):
+        """ Prepare a private query for sending.
+
+        Adds a nonce to ``data``, so must be called as late as possible.
+
+        :param method: API method name
+        :type method: str
+        :param data: API request parameters
+        :type data: dict
+        :returns: API URL path sans host, and HTTPS headers
+        :rtype: tuple
+
+        """
+        data['nonce'] = self._nonce()
+
+        urlpath = self._urlpath('private', method)
+
+        headers = {
+            'API-Key': self.key,
+            'API-Sign': self._sign(data, urlpath)
+        }
+
+        return urlpath, headers
+
+    def _urlpath(self, kind, method):
+        """ API URL path of a method, built once per API version.
+
+        :param kind: ``'public'`` or ``'private'``
+        :type kind: str
+        :param method: API method name
+        :type method: str
+        :returns: API URL path sans host
+        :rtype: str
+
+        """
+        urlpaths = self._urlpaths
+        if urlpaths is None or urlpaths[0] != self.apiversion:
+            urlpaths = (self.apiversion, {'public': {}, 'private': {}})
+            self._urlpaths = urlpaths
+
+        paths = urlpaths[1][kind]
+        urlpath = paths.get(method)
+        if urlpath is None:
+            urlpath = '/' + urlpaths[0] + '/' + kind + '/' + method
+            paths[method] = urlpath
+        return urlpath
+
+    def iter_trades_history(self, start=None, end=None, **data):
+        """ Iterate over trade history, newest first, fetching pages lazily.
+
+        :param start: (optional) earliest time (exclusive), as for
+                      ``TradesHistory``
+        :type start: int or float or str
+        :param end: (optional) latest time (inclusive)
+        :type end: int or float or str
+        :param data: other ``TradesHistory`` request parameters
+        :returns: generator of ``(txid, trade)`` tuples; an asynchronous
+                  generator from :py:class:`krakenex.AsyncAPI`
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        return self._paginate('TradesHistory', 'trades', 'time',
+                              start, end, data)
+
+    def iter_ledgers(self, start=None, end=None, **data):
+        """ Iterate over ledger entries, newest first, fetching pages lazily.
+
+        :param start: (optional) earliest time (exclusive), as for
+                      ``Ledgers``
+        :type start: int or float or str
+        :param end: (optional) latest time (inclusive)
+        :type end: int or float or str
+        :param data: other ``Ledgers`` request parameters
+        :returns: generator of ``(ledger_id, entry)`` tuples; an asynchronous
+                  generator from :py:class:`krakenex.AsyncAPI`
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        return self._paginate('Ledgers', 'ledger', 'time',
+                              start, end, data)
+
+    def iter_closed_orders(self, start=None, end=None, closetime='open', **data):
+        """ Iterate over closed orders, newest first, fetching pages lazily.
+
+        :param start: (optional) earliest time (exclusive), as for
+                      ``ClosedOrders``
+        :type start: int or float or str
+        :param end: (optional) latest time (inclusive)
+        :type end: int or float or str
+        :param closetime: (optional) whether ``start`` and ``end`` refer to
+                          the ``'open'`` or ``'close'`` time of orders
+        :type closetime: str
+        :param data: other ``ClosedOrders`` request parameters
+        :returns: generator of ``(txid, order)`` tuples; an asynchronous
+                  generator from :py:class:`krakenex.AsyncAPI`
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        data['closetime'] = closetime
+        timefield = 'closetm' if closetime == 'close' else 'opentm'
+        return self._paginate('ClosedOrders', 'closed', timefield,
+                              start, end, data)
+
+    def _cached_websockets_token(self, margin=60):
+        """ Get the last WebSocket token, if it is not about to expire.
+
+        :param margin: (optional) seconds before expiry to stop using it
+        :type margin: int or float
+        :returns: token, or ``None``
+
+        """
+        if self._websockets_token is None:
+            return None
+        token, expires = self._websockets_token
+        if time.monotonic() + margin >= expires:
+            return None
+        return token
+
+    def _store_websockets_token(self, response):
+        """ Remember a WebSocket token from a ``GetWebSocketsToken`` response.
+
+        :param response: deserialised query response
+        :type response: dict
+        :returns: token
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if the response has errors
+
+        """
+        if response['error']:
+            raise KrakenError(response['error'])
+        result = response['result']
+        self._websockets_token = (result['token'],
+                                  time.monotonic() + result['expires'])
+        return result['token']
+
+    def _nonce(self):
+        """ Nonce counter.
+
+        Delegates to :py:attr:`nonce`, so is safe to call from several
+        threads.
+
+        :returns: an always-increasing unsigned integer (up to 64 bits wide)
+
+        """
+        return self.nonce()
+
+    def _sign(self, data, urlpath):
+        """ Sign request data according to Kraken's scheme.
+
+        :param data: API request parameters
+        :type data: dict
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :returns: signature digest
+        """
+        postdata = urllib.parse.urlencode(data)
+
+        # Unicode-objects must be encoded before hashing
+        encoded = (str(data['nonce']) + postdata).encode()
+        message = urlpath.encode() + hashlib.sha256(encoded).digest()
+
+        signature = self._hmac()
+        signature.update(message)
+        sigdigest = base64.b64encode(signature.digest())
+
+        return sigdigest.decode()
+
+    def _hmac(self):
+        """ HMAC-SHA512 keyed with the decoded secret, ready for a message.
+
+        Decoding the secret and keying the HMAC are done once, and the
+        result copied for each call; both are redone if :py:attr:`secret`
+        is changed.
+
+        :returns: :py:class:`hmac.HMAC` object
+
+        """
+        signer = self._signer
+        if signer is None or signer[0] != self.secret:
+            signer = (self.secret, hmac.new(base64.b64decode(self.secret),
+                                            digestmod=hashlib.sha512))
+            self._signer = signer
+        return signer[1].copy()
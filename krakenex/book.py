@@ -0,0 +1,304 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Local copy of an order book, kept up to date incrementally."""
+
+import asyncio
+import bisect
+import decimal
+import zlib
+
+from .errors import ChecksumError, KrakenError
+
+class _Side(object):
+    """ One side of an order book.
+
+    Levels are kept in a dictionary keyed by numeric price, and the keys
+    in a sorted list, best price first. Prices and volumes are kept as
+    the strings Kraken sent, since the checksum is computed over those.
+
+    """
+    __slots__ = ('levels', 'keys', 'sign')
+
+    def __init__(self, sign):
+        # key -> (price, volume)
+        self.levels = {}
+        self.keys = []
+        # +1 for asks (ascending), -1 for bids (descending)
+        self.sign = sign
+
+    def clear(self):
+        self.levels.clear()
+        del self.keys[:]
+
+    def set(self, price, volume):
+        key = self.sign * float(price)
+        if float(volume) == 0:
+            if self.levels.pop(key, None) is not None:
+                del self.keys[bisect.bisect_left(self.keys, key)]
+            return
+        if key not in self.levels:
+            bisect.insort(self.keys, key)
+        self.levels[key] = (price, volume)
+
+    def truncate(self, depth):
+        for key in self.keys[depth:]:
+            del self.levels[key]
+        del self.keys[depth:]
+
+    def top(self, count):
+        levels = self.levels
+        return [levels[key] for key in self.keys[:count]]
+
+class OrderBook(object):
+    """ Local order book for a single asset pair.
+
+    Starts from a WebSocket ``book`` snapshot (or a ``Depth`` snapshot
+    fetched over the REST API), and is kept up to date by applying
+    WebSocket ``book`` updates. Each update that carries a checksum is
+    verified against it. On mismatch, the book is emptied and marked
+    :py:attr:`stale`, and, if a WebSocket object was given, the ``book``
+    subscription is made again so that Kraken sends a fresh snapshot;
+    otherwise, :py:exc:`krakenex.ChecksumError` is raised. Updates are
+    ignored while the book is stale.
+
+    .. code-block:: python
+
+       feed = krakenex.WebSocket()
+       book = krakenex.OrderBook(depth=10, websocket=feed)
+       await feed.subscribe('book', ['XBT/USD'], depth=10)
+       async for message in feed:
+           if isinstance(message, list):
+               book.apply_message(message)
+
+    Levels are kept sorted, so the best price is found in constant time
+    and a level in ``O(log n)``; inserting a new level additionally moves
+    the keys below it, of which there are at most ``depth``.
+
+    """
+    def __init__(self, pair=None, depth=10, api=None, websocket=None):
+        """ Create an empty book.
+
+        :param pair: (optional) asset pair name for REST queries,
+                     e.g. ``'XXBTZUSD'``
+        :type pair: str
+        :param depth: (optional) number of levels kept on each side; must
+                      match the WebSocket subscription depth
+        :type depth: int
+        :param api: (optional) used to fetch REST snapshots
+        :type api: krakenex.API
+        :param websocket: (optional) carrying the ``book`` subscription,
+                          to make it again on checksum mismatch
+        :type websocket: krakenex.WebSocket
+        :returns: None
+
+        """
+        self.pair = pair
+        self.depth = depth
+        self.api = api
+        self.websocket = websocket
+        #: WebSocket name of the pair, e.g. ``'XBT/USD'``, once a
+        #: message for it has been applied
+        self.wsname = None
+        #: ``True`` from a checksum mismatch until the next snapshot
+        self.stale = False
+        self.asks = _Side(1)
+        self.bids = _Side(-1)
+        # (pair_decimals, lot_decimals), from AssetPairs
+        self._decimals = None
+        self._resubscribing = None
+        return
+
+    def sync(self):
+        """ Reload the book from a REST ``Depth`` snapshot.
+
+        REST responses carry prices and volumes with fewer decimals than
+        the WebSocket feed, and the checksum is computed over the latter.
+        So they are reformatted to the pair's ``pair_decimals`` and
+        ``lot_decimals``, fetched with ``AssetPairs`` on first use.
+
+        Kraken does not sequence REST snapshots with the WebSocket feed;
+        updates already applied to the feed's own snapshot may be missing
+        from it, or applied twice. Prefer the feed's snapshot when there
+        is one.
+
+        :returns: None
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        if self._decimals is None:
+            response = self.api.query_public('AssetPairs', {'pair': self.pair})
+            if response['error']:
+                raise KrakenError(response['error'])
+            entry = next(iter(response['result'].values()))
+            self._decimals = (entry['pair_decimals'], entry['lot_decimals'])
+
+        response = self.api.query_public('Depth', {'pair': self.pair,
+                                                   'count': self.depth})
+        if response['error']:
+            raise KrakenError(response['error'])
+        # result is keyed by Kraken's name for the pair
+        snapshot = next(iter(response['result'].values()))
+        self.load(self._format(snapshot['asks']),
+                  self._format(snapshot['bids']))
+        return
+
+    def _format(self, entries):
+        """ REST ``[price, volume, ...]`` entries, as the WebSocket feed
+        would have sent them.
+
+        :param entries: entries from a ``Depth`` response
+        :type entries: list
+        :returns: ``[price, volume]`` entries
+        :rtype: list
+
+        """
+        prices, lots = self._decimals
+        return [['{:.{}f}'.format(decimal.Decimal(entry[0]), prices),
+                 '{:.{}f}'.format(decimal.Decimal(entry[1]), lots)]
+                for entry in entries]
+
+    def load(self, asks, bids):
+        """ Replace the book's contents.
+
+        Prices and volumes must be strings as the WebSocket feed sends
+        them, for checksums to match.
+
+        :param asks: ``[price, volume, ...]`` entries
+        :type asks: list
+        :param bids: ``[price, volume, ...]`` entries
+        :type bids: list
+        :returns: None
+
+        """
+        for side, entries in ((self.asks, asks), (self.bids, bids)):
+            side.clear()
+            for entry in entries:
+                side.set(entry[0], entry[1])
+            side.truncate(self.depth)
+        self.stale = False
+        return
+
+    def apply(self, update):
+        """ Apply a WebSocket ``book`` snapshot or update.
+
+        :param update: the dictionary part(s) of a ``book`` message; a
+                       single dictionary, or a list of them
+        :type update: dict or list
+        :returns: ``True`` if the book is consistent afterwards, ``False``
+                  if it is stale
+        :rtype: bool
+        :raises: :py:exc:`krakenex.ChecksumError`: on mismatch, if there
+                 is no WebSocket object to resubscribe with
+
+        """
+        if isinstance(update, dict):
+            update = [update]
+
+        checksum = None
+        for part in update:
+            if 'as' in part or 'bs' in part:
+                self.load(part.get('as', []), part.get('bs', []))
+            if self.stale:
+                continue
+            for key, side in (('a', self.asks), ('b', self.bids)):
+                for entry in part.get(key, ()):
+                    side.set(entry[0], entry[1])
+            checksum = part.get('c', checksum)
+
+        if self.stale:
+            return False
+
+        self.asks.truncate(self.depth)
+        self.bids.truncate(self.depth)
+
+        if checksum is None or int(checksum) == self.checksum():
+            return True
+
+        if self.websocket is None or self.wsname is None:
+            raise ChecksumError('Order book checksum mismatch for {}'
+                                .format(self.wsname or self.pair))
+        self.load([], [])
+        self.stale = True
+        if self._resubscribing is None or self._resubscribing.done():
+            self._resubscribing = asyncio.ensure_future(self.resubscribe())
+        return False
+
+    async def resubscribe(self):
+        """ Make the ``book`` subscription again, for a fresh snapshot.
+
+        The subscription remembered by :py:attr:`websocket`, for
+        reconnections, is left as it was.
+
+        :returns: None
+
+        """
+        message = self.websocket._subscription('unsubscribe', 'book',
+                                               [self.wsname],
+                                               {'depth': self.depth})
+        await self.websocket.send(message)
+        message['event'] = 'subscribe'
+        await self.websocket.send(message)
+        return
+
+    def apply_message(self, message):
+        """ Apply a WebSocket ``book`` channel message.
+
+        :param message: deserialised message, as yielded by
+                        :py:class:`krakenex.WebSocket`
+        :type message: list
+        :returns: as for :py:meth:`apply`
+        :rtype: bool
+
+        """
+        # [channel ID, part, (part,) channel name, pair]
+        self.wsname = message[-1]
+        return self.apply([part for part in message if isinstance(part, dict)])
+
+    def checksum(self):
+        """ Compute Kraken's CRC32 checksum of the top 10 levels.
+
+        :returns: checksum
+        :rtype: int
+
+        """
+        parts = []
+        for price, volume in self.asks.top(10) + self.bids.top(10):
+            parts.append(price.replace('.', '').lstrip('0'))
+            parts.append(volume.replace('.', '').lstrip('0'))
+        return zlib.crc32(''.join(parts).encode()) & 0xffffffff
+
+    def best_ask(self):
+        """ Lowest ask.
+
+        :returns: ``(price, volume)`` strings, or ``None`` if no asks
+        :rtype: tuple
+
+        """
+        top = self.asks.top(1)
+        return top[0] if top else None
+
+    def best_bid(self):
+        """ Highest bid.
+
+        :returns: ``(price, volume)`` strings, or ``None`` if no bids
+        :rtype: tuple
+
+        """
+        top = self.bids.top(1)
+        return top[0] if top else None
@@ -0,0 +1,237 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Caching and coalescing of public query responses."""
+
+import asyncio
+import collections
+import threading
+import time
+import urllib.parse
+
+def querykey(urlpath, data):
+    """ Canonical identity of a query.
+
+    Queries with the same path and parameters, in any order, have the
+    same key.
+
+    :param urlpath: API URL path sans host
+    :type urlpath: str
+    :param data: API request parameters
+    :type data: dict
+    :returns: key
+    :rtype: str
+
+    """
+    if not data:
+        return urlpath
+    return urlpath + '?' + urllib.parse.urlencode(sorted(data.items()))
+
+class ResponseCache(object):
+    """ Least-recently-used cache of public query responses.
+
+    Responses are kept for a time-to-live that depends on the API method.
+    Methods without a time-to-live are not cached, nor are responses that
+    carry errors. It is safe to share one cache between threads.
+
+    Cached responses are returned as-is to every caller, so should be
+    treated as read-only.
+
+    Assign an instance to :py:attr:`krakenex.API.cache` to use it.
+
+    """
+    #: method name -> time-to-live in seconds
+    TTLS = {
+        'Time': 1,
+        'SystemStatus': 10,
+        'Assets': 3600,
+        'AssetPairs': 3600,
+        'Ticker': 1,
+    }
+
+    def __init__(self, maxsize=256, ttls=None):
+        """ Create an empty cache.
+
+        :param maxsize: (optional) maximum number of responses kept
+        :type maxsize: int
+        :param ttls: (optional) method name to time-to-live mapping,
+                     added to (or overriding) :py:attr:`TTLS`
+        :type ttls: dict
+        :returns: None
+
+        """
+        self.maxsize = maxsize
+        self.ttls = dict(self.TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry, response), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    def _ttl(self, urlpath):
+        return self.ttls.get(urlpath.rsplit('/', 1)[-1], 0)
+
+    def get(self, urlpath, data):
+        """ Look up a cached response.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param data: API request parameters
+        :type data: dict
+        :returns: cached response, or ``None`` if there is none
+
+        """
+        if self._ttl(urlpath) <= 0:
+            return None
+
+        key = querykey(urlpath, data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, urlpath, data, response):
+        """ Cache a response, if its method has a time-to-live.
+
+        :param urlpath: API URL path sans host
+        :type urlpath: str
+        :param data: API request parameters
+        :type data: dict
+        :param response: deserialised query response
+        :returns: None
+
+        """
+        ttl = self._ttl(urlpath)
+        if ttl <= 0:
+            return
+        if isinstance(response, dict) and response.get('error'):
+            return
+
+        key = querykey(urlpath, data)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return
+
+    def clear(self):
+        """ Drop all cached responses, and reset the counters.
+
+        :returns: None
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        return
+
+class _Flight(object):
+    """ A query in flight, and its outcome once landed. """
+    __slots__ = ('landed', 'response', 'exception')
+
+    def __init__(self):
+        self.landed = threading.Event()
+        self.response = None
+        self.exception = None
+
+class SingleFlight(object):
+    """ Coalesces identical concurrent queries into one.
+
+    While a query is in flight, identical queries do not go out over
+    the network, but wait for it to land, and get the same response
+    (or exception). Queries are identical if they have the same
+    :py:func:`querykey`.
+
+    Responses are returned as-is to every caller, so should be treated
+    as read-only.
+
+    Assign an instance to :py:attr:`krakenex.API.coalescer` to use it.
+    Only public queries are coalesced.
+
+    """
+    def __init__(self):
+        """ Create with nothing in flight.
+
+        :returns: None
+
+        """
+        self._flights = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        return
+
+    def call(self, key, function):
+        """ Call ``function``, unless a call with the same key is in flight.
+
+        :param key: query identity
+        :type key: str
+        :param function: performs the query
+        :type function: callable
+        :returns: what ``function`` returned, here or in the other call
+
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.landed.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.response
+
+        try:
+            flight.response = function()
+        except BaseException as e:
+            flight.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.landed.set()
+
+        return flight.response
+
+    async def acall(self, key, function):
+        """ Like :py:meth:`call`, but for coroutine functions.
+
+        Must only be used from one event loop.
+
+        :param key: query identity
+        :type key: str
+        :param function: returns a coroutine that performs the query
+        :type function: callable
+        :returns: what the coroutine returned, here or in the other call
+
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # one caller giving up must not cancel the query for the others
+        return await asyncio.shield(task)
@@ -0,0 +1,121 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Response body decoders, for use with :py:meth:`krakenex.API.json_decoder`.
+
+.. code-block:: python
+
+   import decimal
+   kraken = krakenex.API().json_decoder(
+       krakenex.decoders.decoder('orjson', numbers=decimal.Decimal)
+   )
+
+A faster JSON library makes decoding faster. Converting numeric strings
+does not: it is a walk over the whole response in Python, after parsing,
+and costs several times as much as parsing itself. It is a convenience;
+where speed matters, convert just the values used, or use
+:py:mod:`krakenex.frames`. ``benchmarks/decode.py`` compares the two.
+
+"""
+
+import json
+
+def loads(backend='json'):
+    """ Get the ``loads`` function of a JSON library.
+
+    :param backend: (optional) ``'json'`` (standard library), ``'orjson'``
+                    or ``'simdjson'`` (``pysimdjson``); the latter two
+                    must be installed separately
+    :type backend: str
+    :returns: function from :py:class:`bytes` to Python object
+    :raises: :py:exc:`ImportError`: if the backend is not installed
+    :raises: :py:exc:`ValueError`: if the backend is unknown
+
+    """
+    if backend == 'json':
+        return json.loads
+    elif backend == 'orjson':
+        import orjson
+        return orjson.loads
+    elif backend == 'simdjson':
+        import simdjson
+        return simdjson.loads
+    raise ValueError('Unknown JSON backend: ' + str(backend))
+
+def convert_numbers(obj, number):
+    """ Convert numeric strings in a deserialised response, in place.
+
+    Kraken sends prices, volumes, costs, etc. as strings with a decimal
+    point. Strings with a decimal point that ``number`` accepts are
+    converted; others, such as transaction IDs, asset names and
+    integer-like cursors, are not. Nor are integer-like amounts, such
+    as the whole lot volume in a ``Ticker`` ask, ``['67000.1', '1',
+    '1.000']``, which becomes ``[Decimal('67000.1'), '1',
+    Decimal('1.000')]``.
+
+    Every value in ``obj`` is visited in Python, so this takes several
+    times as long as parsing the body did.
+
+    :param obj: deserialised response
+    :type obj: dict or list
+    :param number: type to convert to, e.g. :py:class:`decimal.Decimal`
+                   or :py:class:`float`
+    :type number: type
+    :returns: ``obj``
+
+    """
+    stack = [obj]
+    while stack:
+        container = stack.pop()
+        if container.__class__ is dict:
+            items = container.items()
+        else:
+            items = enumerate(container)
+        for key, value in items:
+            cls = value.__class__
+            if cls is str:
+                if '.' in value:
+                    try:
+                        container[key] = number(value)
+                    except (ValueError, ArithmeticError):
+                        pass
+            elif cls is dict or cls is list:
+                stack.append(value)
+    return obj
+
+def decoder(backend='json', numbers=None):
+    """ Make a response body decoder.
+
+    :param backend: (optional) JSON library; see :py:func:`loads`
+    :type backend: str
+    :param numbers: (optional) if given, numeric strings with a decimal
+                    point are converted to this type; integer-like
+                    strings are left as :py:class:`str`, so ``'1'`` may
+                    sit next to ``Decimal('1.000')``. Slower than not
+                    converting; see :py:func:`convert_numbers`
+    :type numbers: type
+    :returns: function from :py:class:`bytes` to Python object
+
+    """
+    parse = loads(backend)
+    if numbers is None:
+        return parse
+
+    def decode(body):
+        return convert_numbers(parse(body), numbers)
+
+    return decode
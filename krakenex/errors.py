@@ -0,0 +1,53 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Exceptions raised by `krakenex`."""
+
+class RateLimitError(Exception):
+    """ A query was refused locally, because it would exceed a rate limit.
+
+    The query was not sent.
+
+    """
+    pass
+
+class KrakenError(Exception):
+    """ Kraken responded with one or more errors.
+
+    The :py:attr:`errors` attribute holds the list of error strings, as
+    found in the ``error`` field of the response.
+
+    """
+    def __init__(self, errors):
+        """ Create from a list of Kraken error strings.
+
+        :param errors: error strings, e.g. ``['EAPI:Invalid nonce']``
+        :type errors: list
+        :returns: None
+
+        """
+        super(KrakenError, self).__init__(', '.join(errors))
+        self.errors = list(errors)
+        return
+
+class ChecksumError(Exception):
+    """ A local order book no longer matches Kraken's checksum.
+
+    The book must be reloaded from a fresh snapshot.
+
+    """
+    pass
@@ -0,0 +1,262 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Batches of history export reports."""
+
+import concurrent.futures
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+from .errors import KrakenError
+
+class Exports(object):
+    """ Requests, waits for, downloads and removes export reports.
+
+    ``ExportStatus`` lists every report of one type, so all pending jobs
+    are checked with one query per report type. Checks start
+    :py:attr:`poll` seconds apart, and back off while nothing finishes.
+
+    The API key must have the "Export data" permission.
+
+    .. code-block:: python
+
+       exports = krakenex.Exports(kraken)
+       for report in ('ledgers', 'trades'):
+           exports.add(report, starttm=1696118400, endtm=1698796800)
+       paths = exports.run('reports/')
+
+    """
+    #: status of a finished report
+    PROCESSED = 'Processed'
+    #: bytes to read and write at a time when downloading
+    CHUNK_SIZE = 1048576
+
+    def __init__(self, api, poll=10, max_poll=120, backoff=1.5, workers=4):
+        """ Create an empty batch.
+
+        :param api: object with a valid key/secret pair
+        :type api: krakenex.API
+        :param poll: (optional) seconds between the first status checks
+        :type poll: int or float
+        :param max_poll: (optional) longest wait between status checks
+        :type max_poll: int or float
+        :param backoff: (optional) factor to lengthen the wait by each
+                        time a check finds nothing newly finished
+        :type backoff: int or float
+        :param workers: (optional) maximum number of downloads in flight
+        :type workers: int
+        :returns: None
+
+        """
+        self.api = api
+        self.poll = poll
+        self.max_poll = max_poll
+        self.backoff = backoff
+        self.workers = workers
+        # report ID -> report type
+        self.jobs = {}
+        # report ID -> status entry, once processed
+        self.finished = {}
+        return
+
+    def _check(self, response):
+        if response['error']:
+            raise KrakenError(response['error'])
+        return response['result']
+
+    def add(self, report, description=None, format='CSV', **data):
+        """ Request a report.
+
+        :param report: ``'trades'`` or ``'ledgers'``
+        :type report: str
+        :param description: (optional) report description; generated if
+                            not given
+        :type description: str
+        :param format: (optional) ``'CSV'`` or ``'TSV'``
+        :type format: str
+        :param data: other ``AddExport`` request parameters, e.g.
+                     ``starttm``, ``endtm`` or ``fields``
+        :returns: report ID
+        :rtype: str
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken refused the request
+
+        """
+        if description is None:
+            description = 'krakenex {} {}-{}'.format(report,
+                                                     data.get('starttm', ''),
+                                                     data.get('endtm', ''))
+        data = dict(data, report=report, description=description,
+                    format=format)
+        result = self._check(self.api.query_private('AddExport', data))
+        self.jobs[result['id']] = report
+        return result['id']
+
+    def status(self):
+        """ Check on all unfinished reports, one query per report type.
+
+        :returns: report IDs newly found to be finished
+        :rtype: list
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+        :raises: :py:exc:`ValueError`: if a report is no longer listed
+
+        """
+        pending = [id for id in self.jobs if id not in self.finished]
+        finished = []
+        for report in sorted(set(self.jobs[id] for id in pending)):
+            entries = self._check(self.api.query_private('ExportStatus',
+                                                         {'report': report}))
+            entries = dict((entry['id'], entry) for entry in entries)
+            for id in pending:
+                if self.jobs[id] != report:
+                    continue
+                if id not in entries:
+                    raise ValueError('Export {} is no longer listed'.format(id))
+                if entries[id]['status'] == self.PROCESSED:
+                    self.finished[id] = entries[id]
+                    finished.append(id)
+        return finished
+
+    def wait(self, timeout=None):
+        """ Wait for all reports to finish.
+
+        :param timeout: (optional) seconds to give up after
+        :type timeout: int or float
+        :returns: None
+        :raises: :py:exc:`TimeoutError`: if ``timeout`` passed first
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.poll
+        while True:
+            if self.status():
+                delay = self.poll
+            if len(self.finished) == len(self.jobs):
+                return
+
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError('{} exports not ready'.format(
+                    len(self.jobs) - len(self.finished)))
+            time.sleep(delay)
+            delay = min(delay * self.backoff, self.max_poll)
+
+    def _retrieve(self, id):
+        body = self.api.query_private('RetrieveExport', {'id': id},
+                                      stream=True)
+        # errors come back as JSON, the report as application/zip
+        if 'json' in body.headers.get('Content-Type', ''):
+            try:
+                response = json.loads(body.read().decode())
+            finally:
+                body.close()
+            raise KrakenError(response['error'])
+        return body
+
+    def _save(self, id, body, path, slots):
+        try:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(body, f, self.CHUNK_SIZE)
+        finally:
+            body.close()
+            slots.release()
+        with zipfile.ZipFile(path) as archive:
+            bad = archive.testzip()
+        if bad is not None:
+            raise zipfile.BadZipFile('Export {} is corrupt: {}'.format(id, bad))
+        return path
+
+    def download(self, directory):
+        """ Download all finished reports concurrently, and check them.
+
+        Files are named ``<report>-<id>.zip``.
+
+        Each ``RetrieveExport`` carries a nonce, so the requests are sent
+        one at a time, in order, from the calling thread; only the
+        report bodies are read and written concurrently, at most
+        :py:attr:`workers` at a time.
+
+        :param directory: directory to write reports to
+        :type directory: str
+        :returns: report ID -> file path
+        :rtype: dict
+        :raises: :py:exc:`zipfile.BadZipFile`: if a report is corrupt
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors instead of a report
+
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = dict((id, os.path.join(directory, '{}-{}.zip'.format(
+                         self.jobs[id], id)))
+                     for id in self.finished)
+
+        slots = threading.BoundedSemaphore(self.workers)
+        futures = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for id, path in paths.items():
+                # wait for a body to finish before opening another
+                slots.acquire()
+                try:
+                    body = self._retrieve(id)
+                except BaseException:
+                    slots.release()
+                    raise
+                futures.append(pool.submit(self._save, id, body, path, slots))
+        for future in futures:
+            future.result()
+        return paths
+
+    def remove(self):
+        """ Delete all reports from Kraken, and forget them.
+
+        :returns: None
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken responded with
+                 errors
+
+        """
+        for id in list(self.jobs):
+            self._check(self.api.query_private('RemoveExport',
+                                               {'id': id, 'type': 'delete'}))
+            del self.jobs[id]
+            self.finished.pop(id, None)
+        return
+
+    def run(self, directory, timeout=None):
+        """ Wait for, download, check and remove all reports.
+
+        Reports are removed from Kraken even if waiting or downloading
+        fails, so none are left behind; call :py:meth:`wait`,
+        :py:meth:`download` and :py:meth:`remove` separately to keep
+        them for another try.
+
+        :param directory: directory to write reports to
+        :type directory: str
+        :param timeout: (optional) seconds to wait for reports to finish
+        :type timeout: int or float
+        :returns: report ID -> file path
+        :rtype: dict
+
+        """
+        try:
+            self.wait(timeout)
+            paths = self.download(directory)
+        finally:
+            self.remove()
+        return paths
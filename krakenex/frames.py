@@ -0,0 +1,213 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Typed arrays and data frames from query results.
+
+Each function takes the relevant part of a result, and converts it
+column by column into a :py:mod:`numpy` structured array, instead of
+row by row. Pass the array to :py:func:`frame` for a
+:py:class:`pandas.DataFrame`.
+
+.. code-block:: python
+
+   result = kraken.query_public('OHLC', {'pair': 'XXBTZUSD'})['result']
+   bars = krakenex.frames.ohlc(result['XXBTZUSD'])
+   df = krakenex.frames.frame(bars, index='time')
+
+Prices, volumes and amounts are ``float64`` by default. With
+``decimal=True``, they are :py:class:`decimal.Decimal` objects instead,
+which is exact but slower.
+
+Requires :py:mod:`numpy`, and :py:mod:`pandas` for :py:func:`frame`;
+neither is installed by default.
+
+"""
+
+import decimal as _decimal
+
+#: string columns that take few distinct values
+CATEGORICAL = ('pair', 'type', 'ordertype', 'side', 'subtype', 'aclass',
+               'asset', 'margin_type')
+
+def _array(columns, schema, decimal):
+    """ Build a structured array from columns.
+
+    :param columns: column values, in schema order
+    :type columns: list
+    :param schema: ``(name, dtype)`` pairs; dtype ``None`` marks a
+                   decimal-valued column
+    :type schema: tuple
+    :param decimal: whether decimal-valued columns hold
+                    :py:class:`decimal.Decimal` rather than ``float64``
+    :type decimal: bool
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    import numpy
+
+    dtype = [(name, ('O' if decimal else '<f8') if kind is None else kind)
+             for name, kind in schema]
+    length = len(columns[0]) if columns else 0
+    array = numpy.empty(length, dtype=dtype)
+    if length == 0:
+        return array
+
+    for (name, kind), values in zip(schema, columns):
+        if kind is None and decimal:
+            array[name] = [_decimal.Decimal(value) for value in values]
+        else:
+            array[name] = numpy.array(values, dtype=array.dtype[name])
+    return array
+
+def _rows(rows, schema, decimal):
+    """ Structured array from a list of lists. """
+    columns = list(zip(*rows))[:len(schema)] if rows else []
+    return _array(columns, schema[:len(columns)] if columns else schema, decimal)
+
+def _entries(entries, key, schema, decimal):
+    """ Structured array from a dictionary of dictionaries, keyed by ID. """
+    schema = ((key, 'O'),) + schema
+    if not entries:
+        return _array([], schema, decimal)
+
+    values = list(entries.values())
+    columns = [list(entries)]
+    for name, kind in schema[1:]:
+        missing = '0' if kind is None else ''
+        columns.append([entry.get(name, missing) for entry in values])
+    return _array(columns, schema, decimal)
+
+def ohlc(rows, decimal=False):
+    """ Convert ``OHLC`` bars.
+
+    :param rows: list of bars, as in ``result[pair]``
+    :type rows: list
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for prices
+    :type decimal: bool
+    :returns: array with fields ``time``, ``open``, ``high``, ``low``,
+              ``close``, ``vwap``, ``volume``, ``count``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _rows(rows, (('time', '<i8'), ('open', None), ('high', None),
+                        ('low', None), ('close', None), ('vwap', None),
+                        ('volume', None), ('count', '<i8')), decimal)
+
+def trades(rows, decimal=False):
+    """ Convert public ``Trades``.
+
+    :param rows: list of trades, as in ``result[pair]``
+    :type rows: list
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for prices
+    :type decimal: bool
+    :returns: array with fields ``price``, ``volume``, ``time``,
+              ``side``, ``ordertype``, ``misc`` and, if given,
+              ``trade_id``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _rows(rows, (('price', None), ('volume', None), ('time', '<f8'),
+                        ('side', 'U1'), ('ordertype', 'U1'), ('misc', 'O'),
+                        ('trade_id', '<i8')), decimal)
+
+def depth(rows, decimal=False):
+    """ Convert one side of a ``Depth`` order book.
+
+    :param rows: list of levels, as in ``result[pair]['asks']``
+    :type rows: list
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for prices
+    :type decimal: bool
+    :returns: array with fields ``price``, ``volume``, ``time``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _rows(rows, (('price', None), ('volume', None), ('time', '<i8')),
+                 decimal)
+
+def spread(rows, decimal=False):
+    """ Convert ``Spread`` entries.
+
+    :param rows: list of entries, as in ``result[pair]``
+    :type rows: list
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for prices
+    :type decimal: bool
+    :returns: array with fields ``time``, ``bid``, ``ask``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _rows(rows, (('time', '<i8'), ('bid', None), ('ask', None)),
+                 decimal)
+
+def trades_history(entries, decimal=False):
+    """ Convert private ``TradesHistory`` (or ``QueryTrades``) trades.
+
+    :param entries: trades by txid, as in ``result['trades']``
+    :type entries: dict
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for amounts
+    :type decimal: bool
+    :returns: array with fields ``txid``, ``ordertxid``, ``pair``,
+              ``time``, ``type``, ``ordertype``, ``price``, ``cost``,
+              ``fee``, ``vol``, ``margin``, ``misc``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _entries(entries, 'txid',
+                    (('ordertxid', 'O'), ('pair', 'O'), ('time', '<f8'),
+                     ('type', 'O'), ('ordertype', 'O'), ('price', None),
+                     ('cost', None), ('fee', None), ('vol', None),
+                     ('margin', None), ('misc', 'O')), decimal)
+
+def ledgers(entries, decimal=False):
+    """ Convert private ``Ledgers`` (or ``QueryLedgers``) entries.
+
+    :param entries: entries by ledger ID, as in ``result['ledger']``
+    :type entries: dict
+    :param decimal: (optional) use :py:class:`decimal.Decimal` for amounts
+    :type decimal: bool
+    :returns: array with fields ``id``, ``refid``, ``time``, ``type``,
+              ``subtype``, ``aclass``, ``asset``, ``amount``, ``fee``,
+              ``balance``
+    :rtype: :py:class:`numpy.ndarray`
+
+    """
+    return _entries(entries, 'id',
+                    (('refid', 'O'), ('time', '<f8'), ('type', 'O'),
+                     ('subtype', 'O'), ('aclass', 'O'), ('asset', 'O'),
+                     ('amount', None), ('fee', None), ('balance', None)),
+                    decimal)
+
+def frame(array, index=None):
+    """ Make a data frame from a converted result.
+
+    Columns named in :py:data:`CATEGORICAL` become categorical.
+
+    :param array: as returned by the other functions in this module
+    :type array: :py:class:`numpy.ndarray`
+    :param index: (optional) column to use as index
+    :type index: str
+    :rtype: :py:class:`pandas.DataFrame`
+
+    """
+    import pandas
+
+    df = pandas.DataFrame(array)
+    for name in CATEGORICAL:
+        if name in df.columns:
+            df[name] = df[name].astype('category')
+    if index is not None:
+        df = df.set_index(index)
+    return df
@@ -0,0 +1,198 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""HTTP/2 transport for :py:mod:`requests` sessions."""
+
+import io
+import os.path
+import ssl
+import threading
+
+import requests.adapters
+import requests.exceptions
+import requests.structures
+import requests.utils
+import urllib3
+
+class _Body(object):
+    """ File-like view of a streamed :py:mod:`httpx` response body. """
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_raw()
+        self._buffer = b''
+        return
+
+    def read(self, amt=None):
+        while amt is None or len(self._buffer) < amt:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self._response.close()
+        return
+
+class HTTP2Adapter(requests.adapters.BaseAdapter):
+    """ Transport adapter that sends requests over HTTP/2.
+
+    Many requests in flight at once share one connection, instead of
+    needing one connection each. Mount it on a session, or use
+    :py:meth:`krakenex.API.connection_pool`:
+
+    .. code-block:: python
+
+       kraken.session.mount('https://', krakenex.HTTP2Adapter())
+
+    Requires :py:mod:`httpx` with HTTP/2 support (``httpx[http2]``),
+    which is not installed by default. Certificate verification and
+    client certificates are taken from each request, as the session's
+    ``verify`` and ``cert`` settings; each combination gets its own
+    connections. Proxies are not supported.
+
+    """
+    def __init__(self, max_connections=10):
+        """ Create an adapter.
+
+        :param max_connections: (optional) most connections to keep open
+                                for each ``verify`` and ``cert`` setting,
+                                for requests to different hosts, or when
+                                a server limits concurrent streams
+        :type max_connections: int
+        :returns: None
+
+        """
+        import httpx
+
+        super(HTTP2Adapter, self).__init__()
+        self._httpx = httpx
+        self.max_connections = max_connections
+        # (verify, cert) -> httpx.Client
+        self._clients = {}
+        self._lock = threading.Lock()
+        return
+
+    def _client(self, verify, cert):
+        """ Client for requests with these TLS settings, made on first use.
+
+        :param verify: as for :py:mod:`requests`
+        :type verify: bool or str
+        :param cert: as for :py:mod:`requests`
+        :type cert: str or tuple
+        :rtype: :py:class:`httpx.Client`
+
+        """
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        key = (verify, cert)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                httpx = self._httpx
+                client = httpx.Client(
+                    http2=True, verify=self._context(verify, cert),
+                    limits=httpx.Limits(max_connections=self.max_connections)
+                )
+                self._clients[key] = client
+        return client
+
+    def _context(self, verify, cert):
+        """ TLS context for :py:mod:`requests`-style settings.
+
+        :rtype: :py:class:`ssl.SSLContext`
+
+        """
+        if verify is False:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            if verify is True or verify is None:
+                verify = requests.utils.DEFAULT_CA_BUNDLE_PATH
+            if os.path.isdir(verify):
+                context = ssl.create_default_context(capath=verify)
+            else:
+                context = ssl.create_default_context(cafile=verify)
+        if isinstance(cert, tuple):
+            context.load_cert_chain(*cert)
+        elif cert:
+            context.load_cert_chain(cert)
+        return context
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(read, connect=connect)
+        return self._httpx.Timeout(timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None):
+        httpx = self._httpx
+        client = self._client(verify, cert)
+        outgoing = client.build_request(
+            request.method, request.url, headers=dict(request.headers),
+            content=request.body, timeout=self._timeout(timeout)
+        )
+        try:
+            incoming = client.send(outgoing, stream=True)
+            if not stream:
+                incoming.read()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                   for name, value in incoming.headers.raw]
+        if stream:
+            # as sent, so still compressed if it was
+            body = _Body(incoming)
+        else:
+            # already read and decompressed
+            body = io.BytesIO(incoming.content)
+            headers = [(name, value) for name, value in headers
+                       if name.lower() not in ('content-encoding',
+                                               'content-length')]
+        raw = urllib3.HTTPResponse(
+            body=body, headers=headers, status=incoming.status_code,
+            reason=incoming.reason_phrase, preload_content=False,
+            decode_content=False
+        )
+
+        response = requests.Response()
+        response.status_code = incoming.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(raw.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = raw
+        response.reason = incoming.reason_phrase
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+        return
@@ -0,0 +1,306 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Per-query timings and sizes, for use with :py:attr:`krakenex.API.metrics`.
+
+A sink is any function that takes a :py:class:`Sample`. Set one as the
+:py:attr:`metrics` attribute of a :py:class:`krakenex.API` (or
+:py:class:`krakenex.AsyncAPI`) object, and it is called after every
+query that went over the network:
+
+.. code-block:: python
+
+   latencies = krakenex.metrics.Histogram()
+   kraken.metrics = latencies
+   # ... queries ...
+   latencies.quantile('AddOrder', 0.99)
+
+A sink that raises does not fail the query: the exception is logged to
+the ``krakenex.metrics`` logger instead.
+
+Phases are timed as finely as the HTTP library allows. Neither
+:py:mod:`requests` nor :py:mod:`aiohttp` exposes DNS lookup, connection
+and TLS handshake times, so ``request`` spans from sending the request
+to receiving the response headers, and includes them when a new
+connection had to be made.
+
+"""
+
+import bisect
+import collections
+import logging
+import threading
+
+from . import version
+
+#: A query's measurements. Times are in seconds.
+#:
+#: ``method`` and ``kind`` (``'public'`` or ``'private'``) name the query;
+#: ``status`` is the HTTP status, and ``errors`` Kraken's error messages.
+#: If no response arrived, ``status`` is 0, and ``errors`` holds the name
+#: of the exception raised instead, e.g. ``'ConnectTimeout'``.
+#: ``start`` is when it was sent, as from :py:func:`time.time`. ``sign``
+#: covers the nonce and signature, ``request`` until the response headers
+#: arrived, ``download`` reading the body, ``decode`` deserialising it,
+#: and ``total`` all of them. ``sent`` and ``received`` are body sizes in
+#: bytes, the latter after decompression.
+Sample = collections.namedtuple('Sample', [
+    'method', 'kind', 'status', 'errors', 'start', 'sign', 'request',
+    'download', 'decode', 'total', 'sent', 'received'
+])
+
+#: timed phases, in order
+PHASES = ('sign', 'request', 'download', 'decode', 'total')
+
+_log = logging.getLogger(__name__)
+
+def emit(sink, sample):
+    """ Hand a sample to a sink, logging anything it raises.
+
+    :param sink: function that takes a :py:class:`Sample`
+    :type sink: callable
+    :param sample: measurements of one query
+    :type sample: krakenex.metrics.Sample
+    :returns: None
+
+    """
+    try:
+        sink(sample)
+    except Exception:
+        _log.exception('Metrics sink failed on a %s sample', sample.method)
+    return
+
+def fanout(*sinks):
+    """ Make a sink that hands samples to several others.
+
+    :param sinks: functions that take a :py:class:`Sample`
+    :returns: function that takes a :py:class:`Sample`
+
+    """
+    def sink(sample):
+        for each in sinks:
+            each(sample)
+    return sink
+
+class Histogram(object):
+    """ Latency histograms by method and phase, in the Prometheus style.
+
+    Also counts bytes, HTTP statuses and Kraken errors by method. It is
+    safe to share one histogram between threads.
+
+    """
+    #: default bucket upper bounds, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+               1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        """ Create empty histograms.
+
+        :param buckets: (optional) ascending bucket upper bounds, in
+                        seconds; an unbounded one is added
+        :type buckets: tuple
+        :returns: None
+
+        """
+        self.buckets = tuple(buckets)
+        # (method, phase) -> [count per bucket..., count over the last]
+        self._counts = {}
+        # (method, phase) -> sum of seconds
+        self._sums = collections.Counter()
+        # (method, 'sent' or 'received') -> bytes
+        self.bytes = collections.Counter()
+        # (method, status) -> queries
+        self.statuses = collections.Counter()
+        # (method, error message) -> queries
+        self.errors = collections.Counter()
+        self._lock = threading.Lock()
+        return
+
+    def __call__(self, sample):
+        """ Add a sample.
+
+        :param sample: measurements of one query
+        :type sample: krakenex.metrics.Sample
+        :returns: None
+
+        """
+        method = sample.method
+        with self._lock:
+            for phase in PHASES:
+                seconds = getattr(sample, phase)
+                key = (method, phase)
+                counts = self._counts.get(key)
+                if counts is None:
+                    counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                counts[bisect.bisect_left(self.buckets, seconds)] += 1
+                self._sums[key] += seconds
+            self.bytes[(method, 'sent')] += sample.sent
+            self.bytes[(method, 'received')] += sample.received
+            self.statuses[(method, sample.status)] += 1
+            for error in sample.errors:
+                self.errors[(method, error)] += 1
+        return
+
+    def count(self, method, phase='total'):
+        """ Number of samples.
+
+        :param method: API method name
+        :type method: str
+        :param phase: (optional) one of :py:data:`PHASES`
+        :type phase: str
+        :rtype: int
+
+        """
+        with self._lock:
+            return sum(self._counts.get((method, phase), ()))
+
+    def quantile(self, method, q, phase='total'):
+        """ Estimate a latency quantile, as Prometheus'
+        ``histogram_quantile()`` does: by linear interpolation within the
+        bucket it falls in.
+
+        :param method: API method name
+        :type method: str
+        :param q: quantile, e.g. ``0.99``
+        :type q: float
+        :param phase: (optional) one of :py:data:`PHASES`
+        :type phase: str
+        :returns: seconds, or ``None`` if there are no samples; the
+                  largest bound if it falls in the unbounded bucket
+        :rtype: float
+
+        """
+        with self._lock:
+            counts = list(self._counts.get((method, phase), ()))
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count > 0:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def exposition(self, prefix='krakenex'):
+        """ Render in the Prometheus text exposition format.
+
+        :param prefix: (optional) metric name prefix
+        :type prefix: str
+        :rtype: str
+
+        """
+        lines = []
+        name = prefix + '_query_seconds'
+        lines.append('# TYPE {} histogram'.format(name))
+        with self._lock:
+            for (method, phase), counts in sorted(self._counts.items()):
+                labels = 'method="{}",phase="{}"'.format(method, phase)
+                cumulative = 0
+                bounds = ['{!r}'.format(b) for b in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, labels, bound, cumulative))
+                lines.append('{}_sum{{{}}} {!r}'.format(
+                    name, labels, self._sums[(method, phase)]))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, cumulative))
+
+            name = prefix + '_query_bytes_total'
+            lines.append('# TYPE {} counter'.format(name))
+            for (method, direction), count in sorted(self.bytes.items()):
+                lines.append('{}{{method="{}",direction="{}"}} {}'.format(
+                    name, method, direction, count))
+
+            name = prefix + '_query_responses_total'
+            lines.append('# TYPE {} counter'.format(name))
+            for (method, status), count in sorted(self.statuses.items()):
+                lines.append('{}{{method="{}",status="{}"}} {}'.format(
+                    name, method, status, count))
+
+            name = prefix + '_query_errors_total'
+            lines.append('# TYPE {} counter'.format(name))
+            for (method, error), count in sorted(self.errors.items()):
+                error = error.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append('{}{{method="{}",error="{}"}} {}'.format(
+                    name, method, error, count))
+        return '\n'.join(lines) + '\n'
+
+class Spans(object):
+    """ Reports each query as an OpenTelemetry span.
+
+    Spans are made after the fact, with the query's start and end times,
+    as children of whatever span is current when the query returns.
+
+    Requires :py:mod:`opentelemetry` (``opentelemetry-api``), which is
+    not installed by default.
+
+    """
+    def __init__(self, tracer=None):
+        """ Create a sink.
+
+        :param tracer: (optional) tracer to make spans with; one named
+                       ``krakenex`` from the global tracer provider if
+                       not given
+        :type tracer: :py:class:`opentelemetry.trace.Tracer`
+        :returns: None
+
+        """
+        from opentelemetry import trace
+
+        if tracer is None:
+            tracer = trace.get_tracer('krakenex', version.__version__)
+        self.tracer = tracer
+        self._trace = trace
+        return
+
+    def __call__(self, sample):
+        """ Report a sample.
+
+        :param sample: measurements of one query
+        :type sample: krakenex.metrics.Sample
+        :returns: None
+
+        """
+        start = int(sample.start * 1e9)
+        attributes = {
+            'kraken.method': sample.method,
+            'kraken.kind': sample.kind,
+            'http.response.status_code': sample.status,
+            'http.request.body.size': sample.sent,
+            'http.response.body.size': sample.received,
+        }
+        for phase in PHASES:
+            attributes['kraken.{}_seconds'.format(phase)] = getattr(sample, phase)
+        if sample.errors:
+            attributes['kraken.errors'] = list(sample.errors)
+
+        span = self.tracer.start_span('kraken ' + sample.method,
+                                      kind=self._trace.SpanKind.CLIENT,
+                                      start_time=start,
+                                      attributes=attributes)
+        if sample.errors or sample.status >= 400:
+            span.set_status(self._trace.Status(
+                self._trace.StatusCode.ERROR, ', '.join(sample.errors)))
+        span.end(end_time=start + int(sample.total * 1e9))
+        return
@@ -0,0 +1,177 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Nonce sources for private queries."""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # not on POSIX; file is still persisted, but not locked
+    fcntl = None
+
+class NonceCounter(object):
+    """ Monotonic, collision-free nonce source.
+
+    Nonce sources are callables that take no arguments and return the
+    next nonce. This is the default one used by :py:class:`krakenex.API`.
+
+    Nonces are the current time in microseconds, but never less than
+    one more than the previous nonce, so they keep increasing even when
+    many are requested in the same microsecond, or the system clock
+    steps backwards. It is safe to share one counter between threads,
+    though requests sent at once may still reach Kraken out of order;
+    see :py:class:`krakenex.API`.
+
+    If a file path is given, the high-water mark is kept there, so that
+    nonces keep increasing across restarts. The file is locked while it
+    is updated, so several processes on one host can share it.
+
+    """
+    #: width of the number stored in the file
+    WIDTH = 20
+
+    def __init__(self, path=None):
+        """ Create a counter.
+
+        :param path: (optional) file to persist the high-water mark in
+        :type path: str
+        :returns: None
+
+        """
+        self.path = path
+        self._last = 0
+        self._lock = threading.Lock()
+        self._fd = None
+        if path is not None:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        return
+
+    def __call__(self):
+        """ Get the next nonce.
+
+        :returns: an always-increasing unsigned integer (up to 64 bits wide)
+
+        """
+        with self._lock:
+            now = int(time.time() * 1000000)
+            if self._fd is None:
+                self._last = max(self._last + 1, now)
+                return self._last
+
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                stored = os.read(self._fd, self.WIDTH).strip()
+                last = max(self._last, int(stored) if stored else 0)
+                self._last = max(last + 1, now)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, str(self._last).zfill(self.WIDTH).encode())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+            return self._last
+
+    def close(self):
+        """ Close the persistence file, if any.
+
+        :returns: None
+
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        return
+
+class SharedNonceCounter(object):
+    """ Nonce source shared by processes through a memory-mapped file.
+
+    For several processes on one host using the same API key. Each
+    process creates its own instance with the same path; the counter
+    lives in a memory-mapped file, and is updated under an exclusive
+    lock, so processes never issue the same nonce, and nonces keep
+    increasing in the order they are issued. Compared to
+    :py:class:`NonceCounter` with a path, no file reads or writes are
+    made per nonce.
+
+    Nonces are the current time in microseconds, or one more than the
+    last nonce issued by any process, whichever is larger. It is safe
+    to share one instance between threads.
+
+    Requires :py:mod:`fcntl`, so is only available on POSIX systems.
+
+    """
+    _format = struct.Struct('<Q')
+
+    def __init__(self, path):
+        """ Map the counter file, creating it if necessary.
+
+        :param path: file to keep the counter in
+        :type path: str
+        :returns: None
+
+        """
+        if fcntl is None:
+            raise OSError('SharedNonceCounter requires fcntl (POSIX)')
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self._format.size:
+                os.ftruncate(self._fd, self._format.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, self._format.size)
+        return
+
+    def __call__(self):
+        """ Get the next nonce.
+
+        :returns: an always-increasing unsigned integer (up to 64 bits wide)
+
+        """
+        # flock() does not exclude threads sharing a file descriptor
+        with self._lock:
+            now = int(time.time() * 1000000)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                nonce = max(self._format.unpack_from(self._map)[0] + 1, now)
+                self._format.pack_into(self._map, 0, nonce)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            return nonce
+
+    def close(self):
+        """ Unmap and close the counter file.
+
+        :returns: None
+
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            os.close(self._fd)
+        return
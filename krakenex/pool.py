@@ -0,0 +1,293 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Spreading private queries over several API keys."""
+
+import collections
+
+from .api import API
+from .ratelimit import CallCounter
+
+class APIPool(object):
+    """ Sends each private query through the least-loaded suitable key.
+
+    Every key has its own :py:class:`krakenex.API` object, so its own
+    nonce counter, signing state and :py:class:`krakenex.CallCounter`.
+    A query goes to whichever key that has the permission it needs has
+    the lowest counter. If Kraken refuses it for exceeding the rate
+    limit, that key's counter is raised to its maximum and the query is
+    sent through the next key, until none are left.
+
+    Keys can belong to different accounts, labelled when added. A query
+    only goes through keys of one account: the one named with
+    ``account``, or, for ``CancelOrder``, ``EditOrder`` and
+    ``AmendOrder``, the one whose key placed the order, as far as this
+    pool knows. If the pool holds keys for several accounts and neither
+    applies, the query is refused. Only the last :py:attr:`MAXORDERS`
+    orders placed are remembered; cancelling an older one needs
+    ``account``.
+
+    Keys on the same account share the account's matching engine order
+    limit, which no choice of key gets around.
+
+    .. code-block:: python
+
+       pool = krakenex.APIPool(tier='intermediate')
+       pool.load_key('query-1.key')
+       pool.load_key('query-2.key')
+       pool.load_key('trade.key', permissions=('query', 'trade'))
+       pool.query_private('Balance')
+
+    """
+    #: permissions a key can be given
+    PERMISSIONS = ('query', 'trade', 'funds', 'export')
+
+    #: method name -> permission needed; others need ``'query'``
+    REQUIRED = {
+        'AddOrder': 'trade',
+        'AddOrderBatch': 'trade',
+        'AmendOrder': 'trade',
+        'EditOrder': 'trade',
+        'CancelOrder': 'trade',
+        'CancelOrderBatch': 'trade',
+        'CancelAll': 'trade',
+        'CancelAllOrdersAfter': 'trade',
+        'DepositMethods': 'funds',
+        'DepositAddresses': 'funds',
+        'DepositStatus': 'funds',
+        'WithdrawMethods': 'funds',
+        'WithdrawAddresses': 'funds',
+        'WithdrawInfo': 'funds',
+        'Withdraw': 'funds',
+        'WithdrawStatus': 'funds',
+        'WithdrawCancel': 'funds',
+        'WalletTransfer': 'funds',
+        'AddExport': 'export',
+        'ExportStatus': 'export',
+        'RetrieveExport': 'export',
+        'RemoveExport': 'export',
+    }
+
+    #: methods that act on an existing order, given by ``txid``
+    TARGETED = ('CancelOrder', 'EditOrder', 'AmendOrder')
+
+    #: methods whose result ``txid`` lists orders they placed
+    PLACING = ('AddOrder', 'EditOrder')
+
+    #: how many placed orders to remember the account of
+    MAXORDERS = 10000
+
+    def __init__(self, tier='starter'):
+        """ Create an empty pool.
+
+        :param tier: (optional) account verification tier, for the call
+                     counters of keys added without one
+        :type tier: str
+        :returns: None
+
+        """
+        self.tier = tier
+        # [(api, permissions, account)]
+        self.members = []
+        # txid -> account, for orders placed through the pool, oldest first
+        self.orders = collections.OrderedDict()
+        return
+
+    def add(self, api, permissions=('query',), account=None):
+        """ Add a key.
+
+        :param api: object with a valid key/secret pair; given a
+                    :py:class:`krakenex.CallCounter` as its
+                    :py:attr:`limiter` if it has none
+        :type api: krakenex.API
+        :param permissions: (optional) what the key may do, some of
+                            :py:attr:`PERMISSIONS`
+        :type permissions: iterable
+        :param account: (optional) label of the account the key belongs
+                        to; needed only if the pool holds keys for more
+                        than one
+        :type account: str
+        :returns: ``api``
+        :raises: :py:exc:`ValueError`: if a permission is unknown
+
+        """
+        permissions = frozenset(permissions)
+        unknown = permissions.difference(self.PERMISSIONS)
+        if unknown:
+            raise ValueError('Unknown permissions: ' + ', '.join(sorted(unknown)))
+
+        if api.limiter is None:
+            api.limiter = CallCounter(self.tier)
+        self.members.append((api, permissions, account))
+        return api
+
+    def load_key(self, path, permissions=('query',), account=None):
+        """ Add a key from a file; see :py:meth:`krakenex.API.load_key`.
+
+        :param path: path to keyfile
+        :type path: str
+        :param permissions: (optional) what the key may do
+        :type permissions: iterable
+        :param account: (optional) label of the account the key belongs to
+        :type account: str
+        :returns: new object holding the key
+        :rtype: krakenex.API
+
+        """
+        api = API()
+        api.load_key(path)
+        return self.add(api, permissions, account)
+
+    def permission(self, method):
+        """ Permission needed for an API method.
+
+        :param method: API method name
+        :type method: str
+        :rtype: str
+
+        """
+        return self.REQUIRED.get(method, 'query')
+
+    def account(self, method, data=None):
+        """ Account a private query must go through, if it can be told.
+
+        :param method: API method name
+        :type method: str
+        :param data: (optional) API request parameters
+        :type data: dict
+        :returns: account label, or ``None`` if all keys are on one
+                  account
+        :raises: :py:exc:`ValueError`: if the pool holds keys for several
+                 accounts, and the query does not target an order placed
+                 through it
+
+        """
+        if method in self.TARGETED and data:
+            account = self.orders.get(data.get('txid'))
+            if account is not None:
+                return account
+        accounts = set(account for _, _, account in self.members)
+        if len(accounts) > 1:
+            raise ValueError('Keys for several accounts; give the account '
+                             'to query ' + method)
+        return None
+
+    def choose(self, method, exclude=(), account=None):
+        """ Pick the key to send a query through.
+
+        :param method: API method name
+        :type method: str
+        :param exclude: (optional) objects not to pick
+        :type exclude: iterable
+        :param account: (optional) only pick keys of this account
+        :type account: str
+        :returns: least-loaded object with the needed permission, or
+                  ``None`` if there is none
+        :rtype: krakenex.API
+
+        """
+        permission = self.permission(method)
+        candidates = [api for api, permissions, label in self.members
+                      if permission in permissions and api not in exclude
+                      and (account is None or label == account)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda api: api.limiter.level())
+
+    def query_public(self, method, data=None, timeout=None):
+        """ Performs a public query through the first key's session.
+
+        Public queries are limited per IP address, not per key.
+
+        :param method: API method name
+        :type method: str
+        :param data: (optional) API request parameters
+        :type data: dict
+        :param timeout: (optional) passed to
+                        :py:meth:`krakenex.API.query_public`
+        :type timeout: int or float
+        :returns: :py:meth:`requests.Response.json`-deserialised Python object
+        :raises: :py:exc:`ValueError`: if the pool is empty
+
+        """
+        if not self.members:
+            raise ValueError('No keys in the pool')
+        return self.members[0][0].query_public(method, data, timeout=timeout)
+
+    def query_private(self, method, data=None, timeout=None, account=None):
+        """ Performs a private query through the least-loaded suitable key.
+
+        :param method: API method name
+        :type method: str
+        :param data: (optional) API request parameters
+        :type data: dict
+        :param timeout: (optional) passed to
+                        :py:meth:`krakenex.API.query_private`
+        :type timeout: int or float
+        :param account: (optional) account to query; see :py:meth:`account`
+                        for when it is needed
+        :type account: str
+        :returns: :py:meth:`requests.Response.json`-deserialised Python
+                  object; the last refusal if every key was over the limit
+        :raises: :py:exc:`ValueError`: if no key of the account has the
+                 needed permission, or the account cannot be told
+
+        """
+        if data is None:
+            data = {}
+        if account is None:
+            account = self.account(method, data)
+
+        tried = []
+        while True:
+            api = self.choose(method, tried, account)
+            if api is None:
+                if tried:
+                    return response
+                raise ValueError('No key may query ' + method)
+
+            # each attempt gets its own nonce
+            response = api.query_private(method, dict(data), timeout=timeout)
+            if 'EAPI:Rate limit exceeded' not in response['error']:
+                break
+            api.limiter.saturate()
+            tried.append(api)
+
+        if account is not None and not response['error']:
+            self._track(method, data, response, account)
+        return response
+
+    def _track(self, method, data, response, account):
+        """ Remember which account placed or cancelled orders.
+
+        :returns: None
+
+        """
+        if method == 'CancelOrder':
+            self.orders.pop(data.get('txid'), None)
+        elif method in self.PLACING:
+            result = response.get('result') or {}
+            txids = result.get('txid', [])
+            if isinstance(txids, str):
+                txids = [txids]
+            if method == 'EditOrder':
+                self.orders.pop(data.get('txid'), None)
+            for txid in txids:
+                self.orders[txid] = account
+            while len(self.orders) > self.MAXORDERS:
+                self.orders.popitem(last=False)
+        return
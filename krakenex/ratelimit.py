@@ -0,0 +1,326 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Client-side models of Kraken's rate limits."""
+
+import collections
+import threading
+import time
+
+from .errors import RateLimitError
+
+class CallCounter(object):
+    """ Models the per-key API call counter.
+
+    Every private query adds its cost to the counter, and the counter
+    decays at a rate that depends on the account's verification tier.
+    Kraken rejects queries that would take the counter above its maximum.
+
+    :py:meth:`reserve` books a query against the counter and tells how
+    long to wait before sending it, so that queries are delayed just
+    enough instead of being rejected. It is safe to share one counter
+    between threads.
+
+    Assign an instance to :py:attr:`krakenex.API.limiter` to use it.
+
+    """
+    #: tier name -> (maximum, decay per second)
+    TIERS = {
+        'starter': (15, 0.33),
+        'intermediate': (20, 0.5),
+        'pro': (20, 1.0),
+    }
+
+    #: method name -> counter increment; others cost 1
+    COSTS = {
+        'Ledgers': 2,
+        'QueryLedgers': 2,
+        'TradesHistory': 2,
+        'QueryTrades': 2,
+        # counted by the matching engine instead
+        'AddOrder': 0,
+        'AddOrderBatch': 0,
+        'AmendOrder': 0,
+        'EditOrder': 0,
+        'CancelOrder': 0,
+        'CancelOrderBatch': 0,
+        'CancelAll': 0,
+        'CancelAllOrdersAfter': 0,
+    }
+
+    def __init__(self, tier='starter', maximum=None, decay=None):
+        """ Create an empty counter.
+
+        :param tier: (optional) account verification tier, one of
+                     :py:attr:`TIERS`
+        :type tier: str
+        :param maximum: (optional) override the tier's maximum
+        :type maximum: int or float
+        :param decay: (optional) override the tier's decay per second
+        :type decay: int or float
+        :returns: None
+
+        """
+        tiermax, tierdecay = self.TIERS[tier]
+        self.maximum = tiermax if maximum is None else maximum
+        self.decay = tierdecay if decay is None else decay
+        self._level = 0.0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+        return
+
+    def cost(self, method):
+        """ Counter increment for an API method.
+
+        :param method: API method name
+        :type method: str
+        :returns: increment
+        :rtype: int
+
+        """
+        return self.COSTS.get(method, 1)
+
+    def _decayed(self, now):
+        return max(0.0, self._level - self.decay * (now - self._stamp))
+
+    def level(self):
+        """ Current counter estimate.
+
+        Includes queries that have been reserved but are still waiting
+        to be sent, so may exceed :py:attr:`maximum` while they do.
+
+        :returns: estimated counter value
+        :rtype: float
+
+        """
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def reserve(self, method):
+        """ Book a query against the counter.
+
+        :param method: API method name
+        :type method: str
+        :returns: seconds to wait before sending the query
+        :rtype: float
+
+        """
+        cost = self.cost(method)
+        if cost == 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._level = self._decayed(now) + cost
+            self._stamp = now
+            excess = self._level - self.maximum
+
+        return max(0.0, excess / self.decay)
+
+    def saturate(self):
+        """ Raise the counter to its maximum.
+
+        For when Kraken has refused a query for exceeding the limit, so
+        the estimate was too low.
+
+        :returns: None
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._level = max(self._decayed(now), self.maximum)
+            self._stamp = now
+        return
+
+class OrderThrottle(object):
+    """ Models the per-pair matching engine order rate counter.
+
+    Placing an order adds 1 to the counter of its pair. Cancelling or
+    editing an order adds a penalty that depends on how long ago the
+    order was placed: the younger the order, the higher the penalty.
+    Each pair's counter decays at a rate that depends on the account's
+    verification tier.
+
+    Order age is tracked from the responses to orders placed through
+    this throttle. Orders it has not seen are not charged for, since
+    they are most likely old enough not to be penalised.
+
+    Queries that would exceed the limit are either delayed, or refused
+    with :py:exc:`krakenex.RateLimitError` before they are sent. It is
+    safe to share one throttle between threads.
+
+    Assign an instance to :py:attr:`krakenex.API.order_limiter` to use it.
+
+    """
+    #: tier name -> (maximum, decay per second)
+    TIERS = {
+        'starter': (60, 1.0),
+        'intermediate': (125, 2.34),
+        'pro': (180, 3.75),
+    }
+
+    #: method name -> ((maximum order age in seconds, penalty), ...)
+    PENALTIES = {
+        'CancelOrder': ((5, 8), (10, 6), (15, 5), (45, 4), (90, 2), (300, 1)),
+        'EditOrder': ((5, 6), (10, 5), (15, 4), (45, 2), (90, 1)),
+        'AmendOrder': ((5, 3), (10, 2), (15, 1)),
+    }
+
+    #: orders older than this are never penalised
+    MAXAGE = 300
+
+    def __init__(self, tier='starter', maximum=None, decay=None, block=True):
+        """ Create a throttle with all counters empty.
+
+        :param tier: (optional) account verification tier, one of
+                     :py:attr:`TIERS`
+        :type tier: str
+        :param maximum: (optional) override the tier's maximum
+        :type maximum: int or float
+        :param decay: (optional) override the tier's decay per second
+        :type decay: int or float
+        :param block: (optional) if ``True``, delay queries that would
+                      exceed the limit; otherwise refuse them
+        :type block: bool
+        :returns: None
+
+        """
+        tiermax, tierdecay = self.TIERS[tier]
+        self.maximum = tiermax if maximum is None else maximum
+        self.decay = tierdecay if decay is None else decay
+        self.block = block
+        # pair -> (level, stamp)
+        self._counters = {}
+        # txid -> (pair, time placed), oldest first
+        self._orders = collections.OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    def _decayed(self, pair, now):
+        level, stamp = self._counters.get(pair, (0.0, now))
+        return max(0.0, level - self.decay * (now - stamp))
+
+    def level(self, pair):
+        """ Current counter estimate for a pair.
+
+        :param pair: asset pair, as given in order queries
+        :type pair: str
+        :returns: estimated counter value
+        :rtype: float
+
+        """
+        with self._lock:
+            return self._decayed(pair, time.monotonic())
+
+    def _charge(self, method, data, now):
+        """ Find the pair and cost of an order query.
+
+        :returns: pair and cost, or ``None`` if not counted
+        :rtype: tuple
+
+        """
+        if method == 'AddOrder':
+            pair = data.get('pair')
+            return None if pair is None else (pair, 1)
+
+        penalties = self.PENALTIES.get(method)
+        if penalties is None:
+            return None
+
+        order = self._orders.get(str(data.get('txid')))
+        if order is None:
+            return None
+
+        pair, placed = order
+        age = now - placed
+        for maxage, penalty in penalties:
+            if age < maxage:
+                return pair, penalty
+
+        return None
+
+    def reserve(self, method, data):
+        """ Book an order query against its pair's counter.
+
+        :param method: API method name
+        :type method: str
+        :param data: API request parameters
+        :type data: dict
+        :returns: seconds to wait before sending the query
+        :rtype: float
+        :raises: :py:exc:`krakenex.RateLimitError`: if the query would
+                 exceed the limit and this throttle does not block
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            charge = self._charge(method, data, now)
+            if charge is None:
+                return 0.0
+
+            pair, cost = charge
+            level = self._decayed(pair, now) + cost
+            excess = level - self.maximum
+            if excess > 0 and not self.block:
+                raise RateLimitError('{} would exceed order rate limit for {}'
+                                     .format(method, pair))
+            self._counters[pair] = (level, now)
+
+        return max(0.0, excess / self.decay)
+
+    def record(self, method, data, response):
+        """ Track order age from a query response.
+
+        :param method: API method name
+        :type method: str
+        :param data: API request parameters
+        :type data: dict
+        :param response: deserialised query response
+        :type response: dict
+        :returns: None
+
+        """
+        if method not in ('AddOrder', 'EditOrder', 'CancelOrder'):
+            return
+        if not isinstance(response, dict) or response.get('error'):
+            return
+
+        with self._lock:
+            now = time.monotonic()
+
+            while self._orders:
+                txid, (_, placed) = next(iter(self._orders.items()))
+                if now - placed < self.MAXAGE:
+                    break
+                del self._orders[txid]
+
+            if method == 'AddOrder':
+                pair = data.get('pair')
+                txids = response.get('result', {}).get('txid', [])
+            else:
+                order = self._orders.pop(str(data.get('txid')), None)
+                if order is None or method == 'CancelOrder':
+                    return
+                # an edited order is a new order
+                pair = order[0]
+                txids = [response.get('result', {}).get('txid')]
+
+            for txid in txids:
+                if txid is not None:
+                    self._orders[txid] = (pair, now)
+
+        return
@@ -0,0 +1,222 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Recording queries, and replaying them without a network.
+
+Both are :py:mod:`requests` transport adapters, mounted on a
+:py:class:`krakenex.API` object's session:
+
+.. code-block:: python
+
+   recorder = krakenex.Recorder('session.jsonl')
+   kraken.session.mount('https://', recorder)
+   # ... queries ...
+   recorder.close()
+
+   kraken.session.mount('https://', krakenex.Replayer('session.jsonl'))
+
+Recordings are JSON lines, one per query: method, URL path, request
+parameters, status, content type, body, and time taken. Headers, so
+``API-Key`` and ``API-Sign``, are not recorded, and neither are the
+request parameters in :py:data:`REDACTED`.
+
+"""
+
+import base64
+import io
+import json
+import threading
+import time
+import urllib.parse
+
+import requests.adapters
+import requests.exceptions
+import urllib3
+
+#: request parameters left out of recordings, and ignored when matching
+REDACTED = ('nonce', 'otp')
+
+def _params(request):
+    """ Request parameters, without :py:data:`REDACTED` ones.
+
+    :param request: request being sent
+    :type request: :py:class:`requests.PreparedRequest`
+    :returns: URL path, and parameter name -> value
+    :rtype: tuple
+
+    """
+    url = urllib.parse.urlsplit(request.url)
+    if request.method == 'GET':
+        query = url.query
+    else:
+        query = request.body or ''
+        if isinstance(query, bytes):
+            query = query.decode()
+    params = dict((name, value) for name, value in urllib.parse.parse_qsl(query)
+                  if name not in REDACTED)
+    return url.path, params
+
+def _key(method, path, params):
+    return method, path, tuple(sorted(params.items()))
+
+class Recorder(requests.adapters.HTTPAdapter):
+    """ Transport adapter that records queries as they are made.
+
+    Otherwise behaves like :py:class:`requests.adapters.HTTPAdapter`.
+    Bodies are read in full before being handed on, streamed or not.
+    It is safe to share one recorder between threads.
+
+    """
+    def __init__(self, path, **kwargs):
+        """ Start a recording, overwriting any at ``path``.
+
+        :param path: file to record to
+        :type path: str
+        :param kwargs: passed to :py:class:`requests.adapters.HTTPAdapter`
+        :returns: None
+
+        """
+        super(Recorder, self).__init__(**kwargs)
+        self.path = path
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        return
+
+    def send(self, request, stream=False, **kwargs):
+        start = time.monotonic()
+        response = super(Recorder, self).send(request, stream=stream, **kwargs)
+        body = response.content
+        elapsed = time.monotonic() - start
+
+        if stream:
+            # hand on a body that has not been read yet, and is no
+            # longer compressed
+            headers = dict((name, value)
+                           for name, value in response.headers.items()
+                           if name.lower() not in ('content-encoding',
+                                                   'content-length'))
+            response.raw = urllib3.HTTPResponse(
+                body=io.BytesIO(body), headers=headers,
+                status=response.status_code, preload_content=False
+            )
+
+        path, params = _params(request)
+        entry = {
+            't': round(start - self._start, 6),
+            'elapsed': round(elapsed, 6),
+            'method': request.method,
+            'path': path,
+            'params': params,
+            'status': response.status_code,
+            'type': response.headers.get('Content-Type', ''),
+        }
+        if 'json' in entry['type']:
+            entry['body'] = body.decode()
+        else:
+            entry['body64'] = base64.b64encode(body).decode()
+
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+        return response
+
+    def close(self):
+        """ Finish the recording, and close connections.
+
+        :returns: None
+
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        super(Recorder, self).close()
+        return
+
+class Replayer(requests.adapters.HTTPAdapter):
+    """ Transport adapter that answers queries from a recording.
+
+    Queries are matched on method, URL path and parameters, except
+    those in :py:data:`REDACTED`. Identical queries get their recorded
+    responses in recorded order. Nothing is sent over the network.
+
+    Each response is delayed by the time it took when recorded, divided
+    by ``speed``; with ``speed=None``, responses are immediate.
+
+    """
+    def __init__(self, path, speed=1.0, loop=False):
+        """ Load a recording.
+
+        :param path: file recorded by :py:class:`Recorder`
+        :type path: str
+        :param speed: (optional) how many times faster than recorded to
+                      respond, or ``None`` not to wait at all
+        :type speed: int or float
+        :param loop: (optional) once the responses to a query run out,
+                     start over from its first, instead of failing
+        :type loop: bool
+        :returns: None
+
+        """
+        super(Replayer, self).__init__()
+        self.speed = speed
+        self.loop = loop
+        # key -> [entries, index of next]
+        self._entries = {}
+        self._lock = threading.Lock()
+        with open(path, 'r') as f:
+            for line in f:
+                entry = json.loads(line)
+                key = _key(entry['method'], entry['path'], entry['params'])
+                self._entries.setdefault(key, [[], 0])[0].append(entry)
+        return
+
+    def _next(self, request):
+        path, params = _params(request)
+        key = _key(request.method, path, params)
+        with self._lock:
+            recorded = self._entries.get(key)
+            if recorded is None or \
+               (recorded[1] >= len(recorded[0]) and not self.loop):
+                raise requests.exceptions.ConnectionError(
+                    'No recorded response to {} {}'.format(request.method, path),
+                    request=request
+                )
+            entries, index = recorded
+            recorded[1] = (index + 1) % len(entries) if self.loop else index + 1
+        return entries[index]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None):
+        entry = self._next(request)
+        if self.speed is not None:
+            time.sleep(entry['elapsed'] / self.speed)
+
+        if 'body' in entry:
+            body = entry['body'].encode()
+        else:
+            body = base64.b64decode(entry['body64'])
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(body), status=entry['status'],
+            headers={'Content-Type': entry['type'],
+                     'Content-Length': str(len(body))},
+            preload_content=False
+        )
+        return self.build_response(request, raw)
+
+    def close(self):
+        return
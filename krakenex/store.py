@@ -0,0 +1,234 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Columnar on-disk storage of ``OHLC`` and ``Trades`` results.
+
+Each column of each table is a flat file of fixed-width little-endian
+values, under ``<root>/<pair>/<table>/<column>``. Rows are only ever
+appended, in time order, so the ``time`` column doubles as the index:
+time ranges are found by binary search on it. Reads memory-map the
+files, and return :py:mod:`numpy` arrays without copying.
+
+Requires :py:mod:`numpy`, which is not installed by default.
+
+"""
+
+import os
+
+#: table name -> ((column name, dtype), ...); ``time`` comes first
+SCHEMAS = {
+    # time in seconds
+    'ohlc': (('time', '<i8'), ('open', '<f8'), ('high', '<f8'),
+             ('low', '<f8'), ('close', '<f8'), ('vwap', '<f8'),
+             ('volume', '<f8'), ('count', '<i8')),
+    # time in nanoseconds; side 0 = buy, 1 = sell; ordertype 0 = limit,
+    # 1 = market; trade_id -1 if not given
+    'trades': (('time', '<i8'), ('price', '<f8'), ('volume', '<f8'),
+               ('side', 'u1'), ('ordertype', 'u1'), ('trade_id', '<i8')),
+}
+
+def _nanoseconds(seconds):
+    # via microseconds, which a float holds exactly at current times
+    return int(round(float(seconds) * 1000000)) * 1000
+
+class Store(object):
+    """ Append-only columnar store of market data, one table per pair.
+
+    An interrupted append may leave columns of different lengths; the
+    shortest one decides how many rows a table has, and the rest is
+    overwritten by the next append.
+
+    """
+    def __init__(self, root):
+        """ Open a store, creating its directory if necessary.
+
+        :param root: directory to keep files in
+        :type root: str
+        :returns: None
+
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        return
+
+    def _path(self, pair, table, column=None):
+        path = os.path.join(self.root, pair, table)
+        return path if column is None else os.path.join(path, column)
+
+    def _length(self, pair, table):
+        """ Number of complete rows in a table. """
+        import numpy
+
+        lengths = []
+        for column, dtype in SCHEMAS[table]:
+            path = self._path(pair, table, column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths.append(size // numpy.dtype(dtype).itemsize)
+        return min(lengths)
+
+    def _column(self, pair, table, column, dtype, length):
+        import numpy
+
+        if length == 0:
+            return numpy.empty(0, dtype=dtype)
+        return numpy.memmap(self._path(pair, table, column), dtype=dtype,
+                            mode='r', shape=(length,))
+
+    def _last(self, pair, table, column):
+        """ Last stored value of a column, or ``None`` if the table is empty. """
+        length = self._length(pair, table)
+        if length == 0:
+            return None
+        dtype = dict(SCHEMAS[table])[column]
+        return self._column(pair, table, column, dtype, length)[-1]
+
+    def _append(self, pair, table, columns):
+        """ Append columns of equal length to a table.
+
+        :param columns: column name -> sequence of values
+        :type columns: dict
+        :returns: number of rows appended
+        :rtype: int
+
+        """
+        import numpy
+
+        length = self._length(pair, table)
+        os.makedirs(self._path(pair, table), exist_ok=True)
+
+        count = 0
+        for column, dtype in SCHEMAS[table]:
+            values = numpy.asarray(columns[column], dtype=dtype)
+            count = len(values)
+            with open(self._path(pair, table, column), 'ab') as f:
+                # drop the tail of an interrupted append
+                f.truncate(length * values.itemsize)
+                f.write(values.tobytes())
+        return count
+
+    def append_ohlc(self, pair, bars, last=None):
+        """ Append an ``OHLC`` result.
+
+        Bars not newer than the last stored one are skipped. The newest
+        bar Kraken returns is usually still in progress; pass the
+        result's ``last`` to leave it out, and any other bar not yet
+        committed.
+
+        :param pair: asset pair
+        :type pair: str
+        :param bars: ``[time, open, high, low, close, vwap, volume, count]``
+                     entries, as in the ``OHLC`` result
+        :type bars: list
+        :param last: (optional) the ``OHLC`` result's ``last``
+        :type last: int
+        :returns: number of bars appended
+        :rtype: int
+
+        """
+        stored = self._last(pair, 'ohlc', 'time')
+        bars = [bar for bar in bars
+                if (stored is None or bar[0] > stored)
+                and (last is None or bar[0] < int(last))]
+        if not bars:
+            return 0
+
+        names = [name for name, _ in SCHEMAS['ohlc']]
+        columns = dict(zip(names, zip(*bars)))
+        return self._append(pair, 'ohlc', columns)
+
+    def append_trades(self, pair, trades):
+        """ Append a ``Trades`` result.
+
+        Trades not newer than the last stored one (by trade ID if given,
+        otherwise by time) are skipped.
+
+        :param pair: asset pair
+        :type pair: str
+        :param trades: ``[price, volume, time, side, ordertype, misc(, trade_id)]``
+                       entries, as in the ``Trades`` result
+        :type trades: list
+        :returns: number of trades appended
+        :rtype: int
+
+        """
+        if not trades:
+            return 0
+
+        if len(trades[0]) > 6:
+            stored = self._last(pair, 'trades', 'trade_id')
+            trades = [t for t in trades if stored is None or t[6] > stored]
+        else:
+            stored = self._last(pair, 'trades', 'time')
+            trades = [t for t in trades
+                      if stored is None or _nanoseconds(t[2]) > stored]
+        if not trades:
+            return 0
+
+        columns = {
+            'time': [_nanoseconds(t[2]) for t in trades],
+            'price': [t[0] for t in trades],
+            'volume': [t[1] for t in trades],
+            'side': [0 if t[3] == 'b' else 1 for t in trades],
+            'ordertype': [0 if t[4] == 'l' else 1 for t in trades],
+            'trade_id': [t[6] if len(t) > 6 else -1 for t in trades],
+        }
+        return self._append(pair, 'trades', columns)
+
+    def read(self, pair, table, start=None, end=None):
+        """ Read a time range of a table, without copying.
+
+        :param pair: asset pair
+        :type pair: str
+        :param table: ``'ohlc'`` or ``'trades'``
+        :type table: str
+        :param start: (optional) earliest time (inclusive), in the
+                      table's ``time`` unit
+        :type start: int
+        :param end: (optional) latest time (exclusive)
+        :type end: int
+        :returns: column name -> read-only :py:class:`numpy.ndarray` view
+        :rtype: dict
+
+        """
+        length = self._length(pair, table)
+        columns = dict((name, self._column(pair, table, name, dtype, length))
+                       for name, dtype in SCHEMAS[table])
+
+        time = columns['time']
+        first = 0 if start is None else int(time.searchsorted(start, 'left'))
+        stop = length if end is None else int(time.searchsorted(end, 'left'))
+        return dict((name, values[first:stop]) for name, values in columns.items())
+
+    def ohlc(self, pair, start=None, end=None):
+        """ Read stored bars; see :py:meth:`read`.
+
+        :param start: (optional) earliest time (inclusive), in seconds
+        :param end: (optional) latest time (exclusive), in seconds
+        :rtype: dict
+
+        """
+        return self.read(pair, 'ohlc', start, end)
+
+    def trades(self, pair, start=None, end=None):
+        """ Read stored trades; see :py:meth:`read`.
+
+        :param start: (optional) earliest time (inclusive), in nanoseconds
+        :param end: (optional) latest time (exclusive), in nanoseconds
+        :rtype: dict
+
+        """
+        return self.read(pair, 'trades', start, end)
@@ -0,0 +1,555 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""A local stand-in for Kraken's REST API, for tests and load tests.
+
+.. code-block:: python
+
+   import krakenex.testing
+
+   with krakenex.testing.Simulator(latency=0.005) as simulator:
+       kraken = simulator.api()
+       kraken.query_private('AddOrder', {'pair': 'XXBTZUSD', 'type': 'buy',
+                                         'ordertype': 'limit',
+                                         'price': '60000', 'volume': '0.1'})
+
+The simulator checks private queries as Kraken does: the key must be
+known, ``API-Sign`` must be the signature of the request, and the nonce
+must be larger than the last one used with the key, or, with a nonce
+window, not used before and larger than the largest one less the
+window. Each key has a :py:class:`krakenex.CallCounter`; queries that
+would take it over its maximum are refused rather than delayed.
+Latency and ``EService:Unavailable`` errors can be injected.
+
+Market data is synthetic, except for trade histories given to the
+simulator, which ``Trades`` pages through. Limit orders rest until cancelled; market
+orders fill at once at the last price. Balances and orders are kept in
+memory.
+
+"""
+
+import base64
+import collections
+import decimal
+import hashlib
+import hmac
+import http.server
+import io
+import json
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+import zipfile
+
+from .api import API
+from .ratelimit import CallCounter
+
+#: asset name -> ``Assets`` entry
+ASSETS = {
+    'XXBT': {'aclass': 'currency', 'altname': 'XBT', 'decimals': 10,
+             'display_decimals': 5},
+    'XETH': {'aclass': 'currency', 'altname': 'ETH', 'decimals': 10,
+             'display_decimals': 5},
+    'ZUSD': {'aclass': 'currency', 'altname': 'USD', 'decimals': 4,
+             'display_decimals': 2},
+}
+
+#: pair name -> ``AssetPairs`` entry
+PAIRS = {
+    'XXBTZUSD': {'altname': 'XBTUSD', 'wsname': 'XBT/USD', 'base': 'XXBT',
+                 'quote': 'ZUSD', 'pair_decimals': 1, 'lot_decimals': 8,
+                 'ordermin': '0.0001'},
+    'XETHZUSD': {'altname': 'ETHUSD', 'wsname': 'ETH/USD', 'base': 'XETH',
+                 'quote': 'ZUSD', 'pair_decimals': 2, 'lot_decimals': 8,
+                 'ordermin': '0.002'},
+}
+
+#: pair name -> last price
+PRICES = {
+    'XXBTZUSD': decimal.Decimal('67000.0'),
+    'XETHZUSD': decimal.Decimal('3500.00'),
+}
+
+def _nanoseconds(t):
+    """ Trade time in nanoseconds, exactly. """
+    return int(decimal.Decimal(str(t)) * 1000000000)
+
+class _Refused(Exception):
+    """ Query refused, with a Kraken error message. """
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # keep connections alive, as Kraken does
+    protocol_version = 'HTTP/1.1'
+    # headers and body in one packet, not two with a delayed ACK between
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super(_Handler, self).setup()
+        simulator = self.server.simulator
+        with simulator._lock:
+            simulator.connections += 1
+        return
+
+    def log_message(self, format, *args):
+        return
+
+    def _reply(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def _handle(self, kind, params, body):
+        urlpath = urllib.parse.urlsplit(self.path).path
+        parts = urlpath.split('/')
+        if len(parts) != 4 or parts[1] != '0' or parts[2] != kind:
+            self._reply(404, b'')
+            return
+
+        response = self.server.simulator.handle(kind, parts[3], params,
+                                                self.headers, urlpath, body)
+        if isinstance(response, bytes):
+            self._reply(200, response, 'application/zip')
+        else:
+            self._reply(200, json.dumps(response).encode())
+        return
+
+    def do_GET(self):
+        query = urllib.parse.urlsplit(self.path).query
+        self._handle('public', dict(urllib.parse.parse_qsl(query)), '')
+        return
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        self._handle('private', dict(urllib.parse.parse_qsl(body)), body)
+        return
+
+class Simulator(object):
+    """ HTTP server that answers public and private queries locally.
+
+    Public: ``Time``, ``Assets``, ``AssetPairs``, ``Ticker``, ``Depth``
+    and ``Trades``. Private: ``Balance``, ``OpenOrders``, ``AddOrder``,
+    ``CancelOrder``, ``GetWebSocketsToken``, and ``AddExport``,
+    ``ExportStatus``, ``RetrieveExport`` and ``RemoveExport``; exports
+    are processed at once.
+
+    The :py:attr:`counts` attribute counts queries by method, and
+    :py:attr:`refused` counts refusals by error message.
+    :py:attr:`connections` counts connections accepted.
+
+    """
+    def __init__(self, host='127.0.0.1', port=0, keys=None, tier='starter',
+                 limit=True, latency=0.0, errors=0.0, seed=None,
+                 certfile=None, keyfile=None, nonce_window=0, trades=None):
+        """ Create a server without starting it.
+
+        :param host: (optional) address to listen on
+        :type host: str
+        :param port: (optional) port to listen on; any free one if 0
+        :type port: int
+        :param keys: (optional) key -> secret; a single random key if
+                     not given, as :py:attr:`key` and :py:attr:`secret`
+        :type keys: dict
+        :param tier: (optional) account verification tier, for the call
+                     counters
+        :type tier: str
+        :param limit: (optional) whether to refuse private queries over
+                      the call counter limit
+        :type limit: bool
+        :param latency: (optional) seconds to wait before answering, or
+                        a function of no arguments returning them
+        :type latency: int or float or callable
+        :param errors: (optional) fraction of queries to answer with
+                       ``EService:Unavailable``
+        :type errors: float
+        :param seed: (optional) random seed, for repeatable runs
+        :type seed: int
+        :param certfile: (optional) PEM certificate chain; if given, the
+                         server speaks HTTPS instead of HTTP
+        :type certfile: str
+        :param keyfile: (optional) PEM private key, if not in ``certfile``
+        :type keyfile: str
+        :param nonce_window: (optional) how far below the largest nonce
+                             seen a key's nonces may arrive, as Kraken's
+                             per-key setting; with microsecond nonces,
+                             1000000 is one second
+        :type nonce_window: int
+        :param trades: (optional) pair name -> trades, oldest first, in
+                       ``Trades`` result form; ``Trades`` queries for
+                       these pairs are answered from them, paged by
+                       ``since`` and ``count``, instead of made up
+        :type trades: dict
+        :returns: None
+
+        """
+        self._random = random.Random(seed)
+        if keys is None:
+            secret = base64.b64encode(
+                self._random.getrandbits(512).to_bytes(64, 'big')).decode()
+            keys = {'simulator': secret}
+        self.keys = dict(keys)
+        self.key, self.secret = next(iter(self.keys.items()))
+        self.tier = tier
+        self.limit = limit
+        self.latency = latency
+        self.errors = errors
+        self.nonce_window = nonce_window
+        self.trades = dict(trades or {})
+
+        self.counts = collections.Counter()
+        self.refused = collections.Counter()
+        self.connections = 0
+        self.balances = {'XXBT': decimal.Decimal('10'),
+                         'XETH': decimal.Decimal('100'),
+                         'ZUSD': decimal.Decimal('1000000')}
+        # txid -> OpenOrders entry
+        self.orders = collections.OrderedDict()
+        # report ID -> ExportStatus entry
+        self.exports = collections.OrderedDict()
+        # key -> (largest nonce, nonces used within the window)
+        self._nonces = dict((key, (0, set())) for key in self.keys)
+        self._counters = dict((key, CallCounter(tier)) for key in self.keys)
+        # one per key, for nonces and call counters
+        self._key_locks = dict((key, threading.Lock()) for key in self.keys)
+        # for counts, balances and orders
+        self._lock = threading.Lock()
+
+        self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.simulator = self
+        self.certfile = certfile
+        scheme = 'http'
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket,
+                                                     server_side=True)
+            scheme = 'https'
+        self.uri = '{}://{}:{}'.format(scheme, *self.server.server_address[:2])
+        self._thread = None
+        return
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return
+
+    def start(self):
+        """ Start serving, in a background thread.
+
+        :returns: this instance
+
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop serving, and close the socket.
+
+        :returns: None
+
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread = None
+        return
+
+    def api(self, key=None):
+        """ Make an object that queries this server.
+
+        Over HTTPS, the object trusts the server's certificate.
+
+        :param key: (optional) which key to use; :py:attr:`key` if not given
+        :type key: str
+        :rtype: krakenex.API
+
+        """
+        if key is None:
+            key = self.key
+        api = API(key, self.keys[key])
+        api.uri = self.uri
+        if self.certfile is not None:
+            api.session.verify = self.certfile
+            # or REQUESTS_CA_BUNDLE and the like would take precedence
+            api.session.trust_env = False
+        return api
+
+    def _signature(self, secret, urlpath, nonce, body):
+        """ ``API-Sign`` for a request, by Kraken's scheme. """
+        encoded = (nonce + body).encode()
+        message = urlpath.encode() + hashlib.sha256(encoded).digest()
+        signature = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+        return base64.b64encode(signature.digest()).decode()
+
+    def _authenticate(self, method, params, headers, urlpath, body):
+        """ Check a private query's key, signature, nonce and rate. """
+        key = headers.get('API-Key', '')
+        if key not in self.keys:
+            raise _Refused('EAPI:Invalid key')
+
+        nonce = params.get('nonce', '')
+        signature = self._signature(self.keys[key], urlpath, nonce, body)
+        if not hmac.compare_digest(signature, headers.get('API-Sign', '')):
+            raise _Refused('EAPI:Invalid signature')
+
+        with self._key_locks[key]:
+            self._check_nonce(key, nonce)
+            counter = self._counters[key]
+            if self.limit and \
+               counter.level() + counter.cost(method) > counter.maximum:
+                raise _Refused('EAPI:Rate limit exceeded')
+            counter.reserve(method)
+        return
+
+    def _check_nonce(self, key, nonce):
+        """ Accept a nonce for a key, or refuse it.
+
+        Called with the key's lock held.
+
+        """
+        if not nonce.isdigit():
+            raise _Refused('EAPI:Invalid nonce')
+        nonce = int(nonce)
+        largest, used = self._nonces[key]
+        if nonce <= largest - self.nonce_window or nonce in used:
+            raise _Refused('EAPI:Invalid nonce')
+
+        if nonce > largest:
+            floor = nonce - self.nonce_window
+            used = set(each for each in used if each > floor)
+            largest = nonce
+        if self.nonce_window:
+            used.add(nonce)
+        self._nonces[key] = (largest, used)
+        return
+
+    def handle(self, kind, method, params, headers, urlpath, body):
+        """ Answer a query.
+
+        :param kind: ``'public'`` or ``'private'``
+        :type kind: str
+        :param method: API method name
+        :type method: str
+        :param params: request parameters
+        :type params: dict
+        :param headers: request headers
+        :type headers: dict
+        :param urlpath: URL path sans host
+        :type urlpath: str
+        :param body: request body, as signed
+        :type body: str
+        :returns: response, with ``error`` and ``result``, or the
+                  report itself for ``RetrieveExport``
+        :rtype: dict or bytes
+
+        """
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+        handler = getattr(self, '_{}_{}'.format(kind, method), None)
+        try:
+            with self._lock:
+                self.counts[method] += 1
+            if handler is None:
+                raise _Refused('EGeneral:Unknown method')
+            if kind == 'private':
+                self._authenticate(method, params, headers, urlpath, body)
+            if self.errors and self._random.random() < self.errors:
+                raise _Refused('EService:Unavailable')
+            if kind == 'private':
+                with self._lock:
+                    result = handler(params)
+            else:
+                # market data is synthetic, and shares no state
+                result = handler(params)
+        except _Refused as refusal:
+            message = str(refusal)
+            with self._lock:
+                self.refused[message] += 1
+            return {'error': [message]}
+        if isinstance(result, bytes):
+            return result
+        return {'error': [], 'result': result}
+
+    def _pair(self, params):
+        pair = params.get('pair', '')
+        for name, entry in PAIRS.items():
+            if pair in (name, entry['altname'], entry['wsname']):
+                return name
+        raise _Refused('EQuery:Unknown asset pair')
+
+    def _public_Time(self, params):
+        now = int(time.time())
+        return {'unixtime': now,
+                'rfc1123': time.strftime('%a, %d %b %y %H:%M:%S +0000',
+                                         time.gmtime(now))}
+
+    def _public_Assets(self, params):
+        return ASSETS
+
+    def _public_AssetPairs(self, params):
+        return PAIRS
+
+    def _public_Ticker(self, params):
+        pair = self._pair(params)
+        price = PRICES[pair]
+        spread = price / 100000
+        return {pair: {'a': [str(price + spread), '1', '1.000'],
+                       'b': [str(price - spread), '1', '1.000'],
+                       'c': [str(price), '0.01000000']}}
+
+    def _public_Depth(self, params):
+        pair = self._pair(params)
+        count = int(params.get('count', 100))
+        price = PRICES[pair]
+        step = price / 100000
+        now = int(time.time())
+        volume = lambda: '{:.8f}'.format(self._random.expovariate(2))
+        return {pair: {
+            'asks': [[str(price + step * (i + 1)), volume(), now]
+                     for i in range(count)],
+            'bids': [[str(price - step * (i + 1)), volume(), now]
+                     for i in range(count)],
+        }}
+
+    def _public_Trades(self, params):
+        pair = self._pair(params)
+        count = int(params.get('count', 1000))
+        history = self.trades.get(pair)
+        if history is not None:
+            # trades after `since` nanoseconds, as Kraken pages them
+            since = int(params.get('since', 0))
+            page = [trade for trade in history
+                    if _nanoseconds(trade[2]) > since][:count]
+            last = _nanoseconds(page[-1][2]) if page else since
+            return {pair: page, 'last': str(last)}
+
+        price = PRICES[pair]
+        now = time.time()
+        trades = []
+        for i in range(count):
+            t = now - (count - i) * 0.1
+            trades.append([str(price), '{:.8f}'.format(self._random.expovariate(2)),
+                           round(t, 4), self._random.choice('bs'),
+                           self._random.choice('lm'), '', i + 1])
+        return {pair: trades, 'last': str(int(now * 1000000000))}
+
+    def _private_Balance(self, params):
+        return dict((asset, '{:.4f}'.format(amount))
+                    for asset, amount in self.balances.items())
+
+    def _private_OpenOrders(self, params):
+        return {'open': dict(self.orders)}
+
+    def _private_AddOrder(self, params):
+        pair = self._pair(params)
+        side, ordertype = params.get('type'), params.get('ordertype')
+        if side not in ('buy', 'sell') or ordertype not in ('limit', 'market'):
+            raise _Refused('EGeneral:Invalid arguments')
+        try:
+            volume = decimal.Decimal(params['volume'])
+            price = decimal.Decimal(params['price']) if ordertype == 'limit' \
+                    else PRICES[pair]
+        except (KeyError, decimal.InvalidOperation):
+            raise _Refused('EGeneral:Invalid arguments')
+        if volume < decimal.Decimal(PAIRS[pair]['ordermin']):
+            raise _Refused('EOrder:Order minimum not met')
+
+        base, quote = PAIRS[pair]['base'], PAIRS[pair]['quote']
+        if side == 'buy' and self.balances[quote] < volume * price or \
+           side == 'sell' and self.balances[base] < volume:
+            raise _Refused('EOrder:Insufficient funds')
+
+        descr = '{} {} {} @ {} {}'.format(side, params['volume'],
+                                          PAIRS[pair]['altname'],
+                                          ordertype, price)
+        if params.get('validate') in ('true', 'True', '1'):
+            return {'descr': {'order': descr}}
+
+        txid = 'O{:05X}-{:05X}-{:06X}'.format(self._random.getrandbits(20),
+                                              self._random.getrandbits(20),
+                                              self._random.getrandbits(24))
+        if ordertype == 'market':
+            sign = 1 if side == 'buy' else -1
+            self.balances[base] += sign * volume
+            self.balances[quote] -= sign * volume * price
+        else:
+            self.orders[txid] = {
+                'status': 'open', 'opentm': time.time(),
+                'descr': {'pair': PAIRS[pair]['altname'], 'type': side,
+                          'ordertype': ordertype, 'price': str(price),
+                          'order': descr},
+                'vol': params['volume'], 'vol_exec': '0.00000000',
+                'userref': int(params.get('userref', 0)),
+            }
+        return {'descr': {'order': descr}, 'txid': [txid]}
+
+    def _private_CancelOrder(self, params):
+        if self.orders.pop(params.get('txid'), None) is None:
+            raise _Refused('EOrder:Unknown order')
+        return {'count': 1}
+
+    def _private_GetWebSocketsToken(self, params):
+        return {'token': '{:032x}'.format(self._random.getrandbits(128)),
+                'expires': 900}
+
+    def _private_AddExport(self, params):
+        if params.get('report') not in ('trades', 'ledgers') or \
+           'description' not in params:
+            raise _Refused('EGeneral:Invalid arguments')
+        id = ''.join(self._random.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+                     for _ in range(4))
+        now = str(int(time.time()))
+        self.exports[id] = {
+            'id': id, 'descr': params['description'],
+            'format': params.get('format', 'CSV'),
+            'report': params['report'], 'status': 'Processed',
+            'createdtm': now, 'starttm': now, 'completedtm': now,
+            'datastarttm': params.get('starttm', '0'),
+            'dataendtm': params.get('endtm', now),
+        }
+        return {'id': id}
+
+    def _private_ExportStatus(self, params):
+        return [entry for entry in self.exports.values()
+                if entry['report'] == params.get('report')]
+
+    def _private_RetrieveExport(self, params):
+        entry = self.exports.get(params.get('id'))
+        if entry is None:
+            raise _Refused('EQuery:Unknown export')
+        report = io.BytesIO()
+        with zipfile.ZipFile(report, 'w') as archive:
+            archive.writestr('{}.csv'.format(entry['report']),
+                             '"txid","time"\n')
+        return report.getvalue()
+
+    def _private_RemoveExport(self, params):
+        if self.exports.pop(params.get('id'), None) is None:
+            raise _Refused('EQuery:Unknown export')
+        return {params.get('type', 'delete'): True}
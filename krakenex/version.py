@@ -24,3 +24,4 @@ throughout the project.
 
 __version__ = '2.2.2'
 __url__ = 'https://github.com/veox/python3-krakenex'
+__useragent__ = 'krakenex/' + __version__ + ' (+' + __url__ + ')'
@@ -0,0 +1,397 @@
+# This file is part of krakenex.
+#
+# krakenex is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# krakenex is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser
+# General Public LICENSE along with krakenex. If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> and
+# <http://www.gnu.org/licenses/gpl-3.0.txt>.
+
+"""Kraken.com cryptocurrency Exchange WebSocket API."""
+
+import asyncio
+import inspect
+import json
+
+from . import version
+from .errors import KrakenError
+
+class WebSocket(object):
+    """ Maintains a WebSocket connection between this machine and Kraken.
+
+    Subscriptions are remembered, and made again whenever the connection
+    is re-established after being lost. Messages are deserialised, and
+    can be consumed with ``async for``, or handed to a callback by
+    :py:meth:`run`. Heartbeats are dropped.
+
+    Requires :py:mod:`websockets`, which is not installed by default.
+
+    The :py:attr:`connection` attribute is the underlying
+    :py:mod:`websockets` connection, or ``None`` when not connected.
+
+    .. code-block:: python
+
+       feed = krakenex.WebSocket()
+       await feed.subscribe('ticker', ['XBT/USD', 'ETH/USD'])
+       async for message in feed:
+           print(message)
+
+    """
+    def __init__(self, uri='wss://ws.kraken.com', reconnect=1.0,
+                 max_reconnect=60.0):
+        """ Create an object without connecting.
+
+        :param uri: (optional) WebSocket API endpoint
+        :type uri: str
+        :param reconnect: (optional) seconds to wait before the first
+                          reconnection attempt; doubled on each failure
+        :type reconnect: int or float
+        :param max_reconnect: (optional) longest wait between attempts
+        :type max_reconnect: int or float
+        :returns: None
+
+        """
+        self.uri = uri
+        self.reconnect = reconnect
+        self.max_reconnect = max_reconnect
+        self.connection = None
+        self._subscriptions = []
+        self._json_options = {}
+        self._closed = False
+        return
+
+    def json_options(self, **kwargs):
+        """ Set keyword arguments to be passed to JSON deserialization.
+
+        :param kwargs: passed to :py:func:`json.loads`
+        :returns: this instance for chaining
+
+        """
+        self._json_options = kwargs
+        return self
+
+    async def connect(self):
+        """ Connect, and make all remembered subscriptions.
+
+        Does nothing if already connected.
+
+        :returns: None
+
+        """
+        import websockets
+
+        if self.connection is not None:
+            return
+
+        self._closed = False
+        self.connection = await websockets.connect(
+            self.uri, user_agent_header=version.__useragent__
+        )
+        for subscription in self._subscriptions:
+            await self.send(subscription)
+        return
+
+    async def close(self):
+        """ Close the connection, and stop reconnecting.
+
+        :returns: None
+
+        """
+        self._closed = True
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+        return
+
+    async def send(self, message):
+        """ Send a message, as-is.
+
+        :param message: JSON-serialisable message
+        :type message: dict
+        :returns: None
+
+        """
+        await self.connection.send(json.dumps(message))
+        return
+
+    def _subscription(self, event, name, pairs, options):
+        message = {'event': event, 'subscription': dict(options, name=name)}
+        if pairs is not None:
+            message['pair'] = list(pairs)
+        return message
+
+    async def subscribe(self, name, pairs=None, **options):
+        """ Subscribe to a channel, connecting if necessary.
+
+        :param name: channel name, e.g. ``'ticker'``, ``'book'``,
+                     ``'trade'`` or ``'ohlc'``
+        :type name: str
+        :param pairs: (optional) asset pairs, e.g. ``['XBT/USD']``
+        :type pairs: list
+        :param options: other subscription options, e.g. ``depth`` or
+                        ``interval``
+        :returns: None
+
+        """
+        message = self._subscription('subscribe', name, pairs, options)
+        self._subscriptions.append(message)
+        if self.connection is None:
+            await self.connect()
+        else:
+            await self.send(message)
+        return
+
+    async def unsubscribe(self, name, pairs=None, **options):
+        """ Unsubscribe from a channel.
+
+        Arguments must match those given to :py:meth:`subscribe`.
+
+        :param name: channel name
+        :type name: str
+        :param pairs: (optional) asset pairs
+        :type pairs: list
+        :param options: other subscription options
+        :returns: None
+
+        """
+        message = self._subscription('subscribe', name, pairs, options)
+        if message in self._subscriptions:
+            self._subscriptions.remove(message)
+        if self.connection is not None:
+            message['event'] = 'unsubscribe'
+            await self.send(message)
+        return
+
+    async def _reconnect(self):
+        """ Re-establish a lost connection, backing off on failure.
+
+        :returns: None
+
+        """
+        import websockets
+
+        delay = self.reconnect
+        while not self._closed:
+            self.connection = None
+            try:
+                await self.connect()
+                return
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+                pass
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.max_reconnect)
+        return
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """ Wait for the next message, reconnecting if necessary.
+
+        :returns: deserialised message
+        :raises: :py:exc:`StopAsyncIteration`: once :py:meth:`close` is called
+
+        """
+        import websockets
+
+        while not self._closed:
+            if self.connection is None:
+                await self.connect()
+            try:
+                raw = await self.connection.recv()
+            except websockets.ConnectionClosed:
+                await self._reconnect()
+                continue
+
+            message = json.loads(raw, **self._json_options)
+            if isinstance(message, dict) and message.get('event') == 'heartbeat':
+                continue
+            return message
+
+        raise StopAsyncIteration
+
+    async def run(self, callback):
+        """ Hand every message to a callback, until :py:meth:`close` is called.
+
+        :param callback: called with each deserialised message; may be a
+                         coroutine function
+        :type callback: callable
+        :returns: None
+
+        """
+        async for message in self:
+            result = callback(message)
+            if inspect.isawaitable(result):
+                await result
+        return
+
+class PrivateWebSocket(WebSocket):
+    """ Maintains an authenticated WebSocket connection to Kraken.
+
+    Behaves like :py:class:`WebSocket`, but authenticates with a token
+    obtained through a :py:class:`krakenex.API` (or
+    :py:class:`krakenex.AsyncAPI`) object, so private channels such as
+    ``ownTrades`` and ``openOrders`` can be subscribed to, and orders can
+    be placed and cancelled.
+
+    Order requests are correlated with their status messages by request
+    ID. They complete only while messages are being consumed, so
+    iterate over this object (or :py:meth:`run` it) in another task.
+
+    .. code-block:: python
+
+       orders = krakenex.PrivateWebSocket(kraken)
+       await orders.connect()
+       asyncio.ensure_future(orders.run(print))
+       status = await orders.add_order(pair='XBT/USD', type='buy',
+                                       ordertype='limit', price='1',
+                                       volume='1')
+
+    """
+    def __init__(self, api, uri='wss://ws-auth.kraken.com', reconnect=1.0,
+                 max_reconnect=60.0):
+        """ Create an object without connecting.
+
+        :param api: object with a valid key/secret pair, used to get tokens
+        :type api: krakenex.API or krakenex.AsyncAPI
+        :param uri: (optional) authenticated WebSocket API endpoint
+        :type uri: str
+        :param reconnect: (optional) seconds to wait before the first
+                          reconnection attempt; doubled on each failure
+        :type reconnect: int or float
+        :param max_reconnect: (optional) longest wait between attempts
+        :type max_reconnect: int or float
+        :returns: None
+
+        """
+        super(PrivateWebSocket, self).__init__(uri, reconnect, max_reconnect)
+        self.api = api
+        self.token = None
+        self._reqid = 0
+        # reqid -> future
+        self._pending = {}
+        return
+
+    async def _get_token(self):
+        if inspect.iscoroutinefunction(self.api.websockets_token):
+            return await self.api.websockets_token()
+        # blocking query, keep it off the event loop
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.api.websockets_token)
+
+    async def connect(self):
+        """ Get a token, connect, and make all remembered subscriptions.
+
+        Does nothing if already connected.
+
+        :returns: None
+        :raises: :py:exc:`krakenex.KrakenError`: if Kraken refused a token
+
+        """
+        if self.connection is not None:
+            return
+        self.token = await self._get_token()
+        await super(PrivateWebSocket, self).connect()
+        return
+
+    async def send(self, message):
+        """ Send a message, adding the token.
+
+        :param message: JSON-serialisable message
+        :type message: dict
+        :returns: None
+
+        """
+        message = dict(message)
+        if 'subscription' in message:
+            message['subscription'] = dict(message['subscription'],
+                                           token=self.token)
+        else:
+            message['token'] = self.token
+        await super(PrivateWebSocket, self).send(message)
+        return
+
+    async def request(self, event, **params):
+        """ Send a request, and wait for its status message.
+
+        :param event: request event name, e.g. ``'addOrder'``
+        :type event: str
+        :param params: request parameters
+        :returns: deserialised status message
+        :rtype: dict
+        :raises: :py:exc:`krakenex.KrakenError`: if the status is an error
+        :raises: :py:exc:`ConnectionError`: if the connection was lost
+                 before the status arrived
+
+        """
+        if self.connection is None:
+            await self.connect()
+
+        self._reqid += 1
+        reqid = self._reqid
+        future = asyncio.get_event_loop().create_future()
+        self._pending[reqid] = future
+
+        message = dict(params, event=event, reqid=reqid)
+        try:
+            await self.send(message)
+        except BaseException:
+            del self._pending[reqid]
+            raise
+
+        return await future
+
+    async def add_order(self, **params):
+        """ Place an order.
+
+        :param params: order parameters, e.g. ``pair``, ``type``,
+                       ``ordertype``, ``price``, ``volume``
+        :returns: ``addOrderStatus`` message
+        :rtype: dict
+
+        """
+        return await self.request('addOrder', **params)
+
+    async def cancel_order(self, txid):
+        """ Cancel one or more orders.
+
+        :param txid: order transaction ID, or a list of them
+        :type txid: str or list
+        :returns: ``cancelOrderStatus`` message
+        :rtype: dict
+
+        """
+        if isinstance(txid, str):
+            txid = [txid]
+        return await self.request('cancelOrder', txid=list(txid))
+
+    async def _reconnect(self):
+        # status messages for requests in flight will never arrive
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('WebSocket connection lost'))
+        await super(PrivateWebSocket, self)._reconnect()
+        return
+
+    async def __anext__(self):
+        message = await super(PrivateWebSocket, self).__anext__()
+
+        if isinstance(message, dict) and 'reqid' in message \
+           and message.get('event', '').endswith('Status'):
+            future = self._pending.pop(message['reqid'], None)
+            if future is not None and not future.done():
+                if message.get('status') == 'error':
+                    future.set_exception(KrakenError([message.get('errorMessage', '')]))
+                else:
+                    future.set_result(message)
+
+        return message
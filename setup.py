@@ -19,13 +19,15 @@ setup(name='krakenex',
           'requests>=2.18.2,<3'
       ],
       packages=['krakenex'],
-      python_requires='>=3.3',
+      python_requires='>=3.7',
       classifiers=[
           'Programming Language :: Python :: 3',
-          'Programming Language :: Python :: 3.3',
-          'Programming Language :: Python :: 3.4',
-          'Programming Language :: Python :: 3.5',
-          'Programming Language :: Python :: 3.6',
+          'Programming Language :: Python :: 3.7',
+          'Programming Language :: Python :: 3.8',
+          'Programming Language :: Python :: 3.9',
+          'Programming Language :: Python :: 3.10',
+          'Programming Language :: Python :: 3.11',
+          'Programming Language :: Python :: 3.12',
           'License :: OSI Approved :: GNU Lesser General Public License v3 (LGPLv3)',
       ],
 )
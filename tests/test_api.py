@@ -0,0 +1,45 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.API against krakenex.testing.Simulator."""
+
+import shutil
+import subprocess
+
+import pytest
+
+import krakenex.testing
+
+@pytest.fixture(params=['http', 'https'])
+def simulator(request, tmp_path):
+    certfile = keyfile = None
+    if request.param == 'https':
+        if shutil.which('openssl') is None:
+            pytest.skip('needs openssl to make a certificate')
+        certfile = str(tmp_path / 'cert.pem')
+        keyfile = str(tmp_path / 'key.pem')
+        subprocess.check_call(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+             '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+             '-keyout', keyfile, '-out', certfile],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    with krakenex.testing.Simulator(certfile=certfile,
+                                    keyfile=keyfile) as simulator:
+        yield simulator
+
+def test_warmup_connections_are_reused(simulator):
+    kraken = simulator.api().connection_pool(4)
+    kraken.warmup(4)
+    assert simulator.connections == 4
+
+    results = kraken.query_many([('public', 'Time')] * 4, workers=4)
+    assert all(exception is None for _, exception in results)
+    assert simulator.connections == 4
+    kraken.close()
+
+def test_warmup_nothing(simulator):
+    kraken = simulator.api()
+    kraken.warmup(0)
+    assert simulator.connections == 0
+    kraken.close()
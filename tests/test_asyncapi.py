@@ -0,0 +1,115 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.AsyncAPI against krakenex.testing.Simulator."""
+
+import asyncio
+import base64
+import zipfile
+
+import pytest
+
+import krakenex
+import krakenex.testing
+
+pytest.importorskip('aiohttp')
+
+@pytest.fixture
+def simulator():
+    with krakenex.testing.Simulator(limit=False, latency=0.01,
+                                    nonce_window=1000000) as simulator:
+        yield simulator
+
+def client(simulator, key=None):
+    if key is None:
+        key = simulator.key
+    kraken = krakenex.AsyncAPI(key, simulator.keys[key])
+    kraken.uri = simulator.uri
+    return kraken
+
+def run(simulator, queries, key=None):
+    """ Run a coroutine function of a client, closing it afterwards. """
+    async def main():
+        async with client(simulator, key) as kraken:
+            return await queries(kraken)
+    return asyncio.run(main())
+
+def test_public(simulator):
+    async def queries(kraken):
+        return await kraken.query_public('Ticker', {'pair': 'XBTUSD'})
+
+    response = run(simulator, queries)
+    assert response['error'] == []
+    assert 'XXBTZUSD' in response['result']
+
+def test_private(simulator):
+    async def queries(kraken):
+        return await asyncio.gather(*[kraken.query_private('Balance')
+                                      for _ in range(10)])
+
+    responses = run(simulator, queries)
+    assert all(response['error'] == [] for response in responses)
+    assert responses[0]['result']['XXBT'] == '10.0000'
+    assert simulator.counts['Balance'] == 10
+
+def test_private_refused(simulator):
+    async def queries(kraken):
+        kraken.secret = base64.b64encode(bytes(64)).decode()
+        return await kraken.query_private('Balance')
+
+    response = run(simulator, queries)
+    assert response['error'] == ['EAPI:Invalid signature']
+
+def test_coalescer(simulator):
+    async def queries(kraken):
+        kraken.coalescer = krakenex.SingleFlight()
+        return await asyncio.gather(*[kraken.query_public('Time')
+                                      for _ in range(10)])
+
+    responses = run(simulator, queries)
+    assert simulator.counts['Time'] == 1
+    assert all(response is responses[0] for response in responses)
+
+def test_cache(simulator):
+    async def queries(kraken):
+        kraken.cache = krakenex.ResponseCache()
+        first = await kraken.query_public('Assets')
+        second = await kraken.query_public('Assets')
+        return first, second, kraken.cache
+
+    first, second, cache = run(simulator, queries)
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert simulator.counts['Assets'] == 1
+
+def test_query_many_orders_nonces():
+    # no nonce window: out-of-order private queries would be refused
+    with krakenex.testing.Simulator(limit=False, latency=0.005) as simulator:
+        async def queries(kraken):
+            batch = [('private', 'Balance'), ('public', 'Time')] * 8
+            return await kraken.query_many(batch, workers=8)
+
+        results = run(simulator, queries)
+    assert all(exception is None for _, exception in results)
+    assert all(response['error'] == [] for response, _ in results)
+    assert simulator.refused == {}
+
+def test_download_export(simulator, tmp_path):
+    path = str(tmp_path / 'trades.zip')
+
+    async def queries(kraken):
+        added = await kraken.query_private('AddExport', {
+            'report': 'trades', 'description': 'test'})
+        await kraken.download_export(added['result']['id'], path)
+        with pytest.raises(krakenex.KrakenError):
+            await kraken.download_export('NONE', str(tmp_path / 'none.zip'))
+
+    run(simulator, queries)
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['trades.csv']
+
+def test_no_requests_session(simulator):
+    kraken = client(simulator)
+    assert not isinstance(kraken, krakenex.API)
+    assert kraken.session is None
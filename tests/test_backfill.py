@@ -0,0 +1,82 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.Backfill against a fixed history in the simulator."""
+
+import pytest
+
+import krakenex
+import krakenex.testing
+
+#: a trade every quarter second, some of them on slice boundaries
+START = 1700000000
+TRADES = [['67000.0', '0.01000000', START + i * 0.25, 'b', 'l', '', i + 1]
+          for i in range(400)]
+
+@pytest.fixture
+def simulator():
+    with krakenex.testing.Simulator(trades={'XXBTZUSD': TRADES}) as simulator:
+        yield simulator
+
+def backfill(simulator, checkpoint=None, slices=8):
+    job = krakenex.Backfill(simulator.api(), 'XXBTZUSD', START + 10,
+                            START + 90, slices=slices, workers=4,
+                            checkpoint=checkpoint)
+    # many pages per slice
+    job.COUNT = 7
+    return job
+
+def expected():
+    return [trade[6] for trade in TRADES if START + 10 <= trade[2] < START + 90]
+
+def test_slices_join_without_gaps_or_duplicates(simulator):
+    job = backfill(simulator)
+    pages = {}
+    job.run(lambda index, trades: pages.setdefault(index, []).extend(trades))
+
+    assert job.done()
+    # slices in order, concatenated, are the whole range in time order
+    ids = [trade[6] for index in sorted(pages) for trade in pages[index]]
+    assert ids == expected()
+    # each boundary trade went to the slice starting at it
+    for index, (first, last, _, _) in enumerate(job.slices):
+        assert all(first <= trade[2] < last for trade in pages[index])
+        assert pages[index][0][2] == first
+
+def test_resume_from_checkpoint(simulator, tmp_path):
+    checkpoint = str(tmp_path / 'backfill.json')
+    received = []
+    calls = [0]
+
+    def crash(index, trades):
+        calls[0] += 1
+        if calls[0] == 10:
+            raise RuntimeError('crash')
+        received.extend(trades)
+
+    job = backfill(simulator, checkpoint)
+    with pytest.raises(RuntimeError):
+        job.run(crash)
+    assert not job.done()
+
+    resumed = backfill(simulator, checkpoint)
+    assert resumed.slices == job.slices
+    before = simulator.counts['Trades']
+    resumed.run(lambda index, trades: received.extend(trades))
+    queries = simulator.counts['Trades'] - before
+
+    assert resumed.done()
+    ids = sorted(trade[6] for trade in received)
+    # the page that crashed was handed over again; nothing else was
+    assert ids == expected()
+
+    # pages handed over before the crash were not fetched again
+    before = simulator.counts['Trades']
+    backfill(simulator).run(lambda index, trades: None)
+    assert 0 < queries < simulator.counts['Trades'] - before
+
+def test_checkpoint_for_other_backfill(simulator, tmp_path):
+    checkpoint = str(tmp_path / 'backfill.json')
+    backfill(simulator, checkpoint).run(lambda index, trades: None)
+    with pytest.raises(ValueError):
+        backfill(simulator, checkpoint, slices=4)
@@ -0,0 +1,104 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.OrderBook checksums, resubscription and sync."""
+
+import asyncio
+import json
+import re
+
+import pytest
+
+import krakenex
+import krakenex.testing
+
+#: the example book from Kraken's WebSocket checksum documentation
+ASKS = [[price, '0.00000500'] for price in (
+    '0.05005', '0.05010', '0.05015', '0.05020', '0.05025',
+    '0.05030', '0.05035', '0.05040', '0.05045', '0.05050')]
+BIDS = [[price, '0.00000500'] for price in (
+    '0.05000', '0.04995', '0.04990', '0.04980', '0.04975',
+    '0.04970', '0.04965', '0.04960', '0.04955', '0.04950')]
+CHECKSUM = 974947235
+
+def message(part):
+    return [336, part, 'book-10', 'XBT/USD']
+
+def test_checksum_vector():
+    book = krakenex.OrderBook(depth=10)
+    book.load(ASKS, BIDS)
+    assert book.checksum() == CHECKSUM
+
+def test_update_with_matching_checksum():
+    book = krakenex.OrderBook(depth=10)
+    assert book.apply_message(message({'as': ASKS, 'bs': BIDS}))
+    # the same level again, with its checksum unchanged
+    assert book.apply_message(message({'a': [ASKS[0]], 'c': str(CHECKSUM)}))
+    assert book.best_ask() == ('0.05005', '0.00000500')
+
+def test_mismatch_without_websocket_raises():
+    book = krakenex.OrderBook(depth=10)
+    book.apply_message(message({'as': ASKS, 'bs': BIDS}))
+    with pytest.raises(krakenex.ChecksumError):
+        book.apply_message(message({'a': [['0.05006', '1.00000000']],
+                                    'c': str(CHECKSUM)}))
+
+def test_mismatch_resubscribes_and_waits_for_snapshot():
+    websockets = pytest.importorskip('websockets')
+    received = []
+
+    async def handle(connection, *args):
+        async for raw in connection:
+            received.append(json.loads(raw))
+
+    async def main():
+        server = await websockets.serve(handle, '127.0.0.1', 0)
+        port = next(iter(server.sockets)).getsockname()[1]
+        feed = krakenex.WebSocket('ws://127.0.0.1:{}'.format(port))
+        await feed.connect()
+        book = krakenex.OrderBook(depth=10, websocket=feed)
+
+        results = [book.apply_message(message({'as': ASKS, 'bs': BIDS}))]
+        results.append(book.apply_message(message({
+            'a': [['0.05006', '1.00000000']], 'c': str(CHECKSUM)})))
+        assert book.stale
+        assert book.best_ask() is None
+        await asyncio.wait_for(book._resubscribing, 10)
+        # updates for the old book are dropped until a snapshot arrives
+        results.append(book.apply_message(message({
+            'b': [['0.05001', '1.00000000']]})))
+        assert book.best_bid() is None
+        results.append(book.apply_message(message({'as': ASKS, 'bs': BIDS})))
+
+        await feed.close()
+        server.close()
+        await server.wait_closed()
+        return book, results
+
+    book, results = asyncio.run(main())
+    assert results == [True, False, False, True]
+    assert not book.stale
+    assert book.checksum() == CHECKSUM
+    subscription = {'name': 'book', 'depth': 10}
+    assert received == [
+        {'event': 'unsubscribe', 'subscription': subscription,
+         'pair': ['XBT/USD']},
+        {'event': 'subscribe', 'subscription': subscription,
+         'pair': ['XBT/USD']},
+    ]
+
+def test_sync_formats_rest_levels():
+    with krakenex.testing.Simulator() as simulator:
+        book = krakenex.OrderBook('XXBTZUSD', depth=10, api=simulator.api())
+        book.sync()
+        book.sync()
+        assert simulator.counts['AssetPairs'] == 1
+
+    # pair_decimals 1, lot_decimals 8
+    for side in (book.asks, book.bids):
+        levels = side.top(10)
+        assert len(levels) == 10
+        for price, volume in levels:
+            assert re.match(r'^\d+\.\d$', price)
+            assert re.match(r'^\d+\.\d{8}$', volume)
+    assert float(book.best_ask()[0]) > float(book.best_bid()[0])
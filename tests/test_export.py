@@ -0,0 +1,50 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.Exports against krakenex.testing.Simulator."""
+
+import os
+import zipfile
+
+import pytest
+
+import krakenex
+import krakenex.testing
+
+@pytest.fixture
+def simulator():
+    # no nonce window: out-of-order private queries would be refused
+    with krakenex.testing.Simulator(limit=False, latency=0.005) as simulator:
+        yield simulator
+
+def exports(simulator, count):
+    batch = krakenex.Exports(simulator.api(), poll=0.01, workers=4)
+    for i in range(count):
+        batch.add('ledgers' if i % 2 else 'trades', starttm=i)
+    return batch
+
+def test_run_downloads_in_nonce_order(simulator, tmp_path):
+    batch = exports(simulator, 20)
+    paths = batch.run(str(tmp_path))
+
+    assert simulator.refused == {}
+    assert simulator.counts['RetrieveExport'] == 20
+    assert len(paths) == 20
+    for path in paths.values():
+        with zipfile.ZipFile(path) as archive:
+            assert archive.testzip() is None
+    # removed from Kraken, and forgotten
+    assert simulator.exports == {}
+    assert batch.jobs == {}
+
+def test_run_removes_after_failure(simulator, tmp_path):
+    batch = exports(simulator, 4)
+    # a file where the directory should be
+    directory = str(tmp_path / 'reports')
+    open(directory, 'w').close()
+    with pytest.raises(OSError):
+        batch.run(directory)
+
+    assert simulator.exports == {}
+    assert batch.jobs == {}
+    assert os.path.isfile(directory)
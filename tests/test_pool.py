@@ -0,0 +1,76 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of krakenex.APIPool against krakenex.testing.Simulator."""
+
+import base64
+import os
+
+import pytest
+
+import krakenex
+import krakenex.testing
+
+#: key -> account
+ACCOUNTS = {'alice-1': 'alice', 'alice-2': 'alice', 'bob-1': 'bob'}
+
+@pytest.fixture
+def simulator():
+    keys = dict((key, base64.b64encode(os.urandom(64)).decode())
+                for key in ACCOUNTS)
+    with krakenex.testing.Simulator(keys=keys, limit=False) as simulator:
+        yield simulator
+
+@pytest.fixture
+def pool(simulator):
+    pool = krakenex.APIPool()
+    for key, account in sorted(ACCOUNTS.items()):
+        pool.add(simulator.api(key), ('query', 'trade'), account)
+    return pool
+
+def sent(pool, method):
+    """ Keys whose last query was ``method``. """
+    return [api.key for api, _, _ in pool.members
+            if api.response is not None and
+            api.response.request.url.endswith('/' + method)]
+
+def place(pool, account):
+    response = pool.query_private('AddOrder', {
+        'pair': 'XXBTZUSD', 'type': 'buy', 'ordertype': 'limit',
+        'price': '60000', 'volume': '0.001'}, account=account)
+    assert response['error'] == []
+    return response['result']['txid'][0]
+
+def test_several_accounts_need_one_named(pool):
+    with pytest.raises(ValueError):
+        pool.query_private('Balance')
+
+    response = pool.query_private('Balance', account='bob')
+    assert response['error'] == []
+    assert sent(pool, 'Balance') == ['bob-1']
+
+def test_query_goes_through_named_account(pool):
+    for _ in range(4):
+        pool.query_private('Balance', account='alice')
+    assert sorted(sent(pool, 'Balance')) == ['alice-1', 'alice-2']
+
+def test_cancel_follows_placing_account(pool):
+    txid = place(pool, 'bob')
+    assert pool.orders[txid] == 'bob'
+
+    response = pool.query_private('CancelOrder', {'txid': txid})
+    assert response['error'] == []
+    assert sent(pool, 'CancelOrder') == ['bob-1']
+    assert txid not in pool.orders
+
+def test_remembered_orders_are_bounded(pool):
+    pool.MAXORDERS = 3
+    txids = [place(pool, 'alice') for _ in range(5)]
+    assert list(pool.orders) == txids[2:]
+
+    # forgotten, so the account must be given again
+    with pytest.raises(ValueError):
+        pool.query_private('CancelOrder', {'txid': txids[0]})
+    response = pool.query_private('CancelOrder', {'txid': txids[0]},
+                                  account='alice')
+    assert response['error'] == []
@@ -0,0 +1,156 @@
+# This file is part of krakenex.
+# Licensed under the GNU LGPL v3 or later. See `LICENSE.txt`.
+
+"""Tests of the WebSocket clients against a local stand-in server."""
+
+import asyncio
+import json
+
+import pytest
+
+import krakenex
+
+websockets = pytest.importorskip('websockets')
+
+class StandIn(object):
+    """ WebSocket server that answers as Kraken's feeds do, enough for
+    the clients: subscriptions, heartbeats, and order requests.
+
+    """
+    def __init__(self, drop_after=None, reverse=False):
+        # close the first connection after this many channel messages
+        self.drop_after = drop_after
+        # answer order requests in reverse order, two at a time
+        self.reverse = reverse
+        # one list of received messages per connection
+        self.connections = []
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def uri(self):
+        port = next(iter(self.server.sockets)).getsockname()[1]
+        return 'ws://127.0.0.1:{}'.format(port)
+
+    async def handle(self, connection, *args):
+        received = []
+        self.connections.append(received)
+        held = []
+        sent = 0
+        async for raw in connection:
+            message = json.loads(raw)
+            received.append(message)
+            event = message['event']
+            if event == 'subscribe':
+                name = message['subscription']['name']
+                for pair in message.get('pair', [None]):
+                    await connection.send(json.dumps({
+                        'event': 'subscriptionStatus', 'status': 'subscribed',
+                        'pair': pair, 'subscription': message['subscription']
+                    }))
+                    for i in range(3):
+                        await connection.send(json.dumps({'event': 'heartbeat'}))
+                        await connection.send(json.dumps(
+                            [42, {'n': sent}, name, pair]))
+                        sent += 1
+                        if self.drop_after is not None and \
+                           len(self.connections) == 1 and \
+                           sent >= self.drop_after:
+                            await connection.close()
+                            return
+            elif event in ('addOrder', 'cancelOrder'):
+                if event == 'addOrder':
+                    status = {'event': 'addOrderStatus', 'status': 'ok',
+                              'txid': 'O-{}'.format(message['reqid']),
+                              'reqid': message['reqid']}
+                else:
+                    status = {'event': 'cancelOrderStatus', 'status': 'error',
+                              'errorMessage': 'EOrder:Unknown order',
+                              'reqid': message['reqid']}
+                held.append(status)
+                if not self.reverse or len(held) == 2:
+                    for status in reversed(held):
+                        await connection.send(json.dumps(status))
+                    held = []
+
+class Token(object):
+    """ Stands in for an API object, as far as tokens go. """
+    def websockets_token(self):
+        return 'token'
+
+async def take(feed, count):
+    messages = []
+    async for message in feed:
+        messages.append(message)
+        if len(messages) == count:
+            break
+    return messages
+
+def test_subscribe_drops_heartbeats():
+    async def main():
+        async with StandIn() as server:
+            feed = krakenex.WebSocket(server.uri)
+            await feed.subscribe('ticker', ['XBT/USD'])
+            messages = await take(feed, 4)
+            await feed.close()
+        return server, messages
+
+    server, messages = asyncio.run(main())
+    assert server.connections[0][0]['subscription'] == {'name': 'ticker'}
+    assert messages[0]['event'] == 'subscriptionStatus'
+    assert [message[1]['n'] for message in messages[1:]] == [0, 1, 2]
+    assert all(message[2:] == ['ticker', 'XBT/USD'] for message in messages[1:])
+
+def test_reconnect_resubscribes():
+    async def main():
+        async with StandIn(drop_after=4) as server:
+            feed = krakenex.WebSocket(server.uri, reconnect=0.01)
+            await feed.subscribe('book', ['XBT/USD'], depth=10)
+            await feed.subscribe('trade', ['ETH/USD'])
+            messages = await asyncio.wait_for(take(feed, 8), 10)
+            await feed.close()
+        return server, messages
+
+    server, messages = asyncio.run(main())
+    assert len(server.connections) == 2
+    # a new connection makes every remembered subscription again
+    subscribed = [(message['subscription'], message['pair'])
+                  for message in server.connections[1]]
+    assert subscribed == [({'name': 'book', 'depth': 10}, ['XBT/USD']),
+                          ({'name': 'trade'}, ['ETH/USD'])]
+    assert not any(isinstance(message, dict) and
+                   message.get('event') == 'heartbeat' for message in messages)
+
+def test_private_requests_correlated_by_reqid():
+    async def main():
+        async with StandIn(reverse=True) as server:
+            orders = krakenex.PrivateWebSocket(Token(), server.uri)
+            await orders.connect()
+            consumer = asyncio.ensure_future(orders.run(lambda message: None))
+            first, second = await asyncio.wait_for(asyncio.gather(
+                orders.add_order(pair='XBT/USD', type='buy', volume='1'),
+                orders.add_order(pair='XBT/USD', type='sell', volume='2'),
+            ), 10)
+            with pytest.raises(krakenex.KrakenError):
+                await asyncio.wait_for(asyncio.gather(
+                    orders.cancel_order('O-1'), orders.cancel_order('O-2')
+                ), 10)
+            await orders.close()
+            await consumer
+        return server, first, second
+
+    server, first, second = asyncio.run(main())
+    # answered in reverse, but each request got its own status
+    assert (first['reqid'], first['txid']) == (1, 'O-1')
+    assert (second['reqid'], second['txid']) == (2, 'O-2')
+    requests = server.connections[0]
+    assert all(request['token'] == 'token' for request in requests)
+    assert [request['event'] for request in requests] == \
+        ['addOrder', 'addOrder', 'cancelOrder', 'cancelOrder']